@@ -1,14 +1,8 @@
 from sys import argv
 
-import nltk
-
 from bot.logger import logger
 from bot.model_definitions import Mode
 
-# Download the nltk model required for the tokenizer.
-# Will be skipped if the model has already been downloaded.
-nltk.download('punkt', quiet=True)
-
 # Check if the bot has been executed with a command-line arg, i.e. the target
 target = argv[1] if len(argv) > 1 else None
 
@@ -28,6 +22,75 @@ elif target == 'train-sentiments':
     train_model(Mode.AFFECTIONS)
     train_model(Mode.MOODS)
 
+elif target == 'train-all':
+    # Trains the pattern, mood and affection models concurrently, each until
+    # its training loss stops improving
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python -m bot train-all')
+    parser.add_argument('--workers', type=int, default=len(Mode),
+                        help='number of models trained at the same time')
+    args = parser.parse_args(argv[2:])
+
+    from bot.trainer import train_all
+
+    logger.info('Running training of all models')
+    train_all(args.workers)
+
+elif target == 'train-incremental':
+    # Fine-tunes the existing models whose pattern definition files changed
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python -m bot train-incremental')
+    parser.add_argument('modes', nargs='*', type=Mode,
+                        help='modes to update (patterns, moods, affections), all by default')
+    parser.add_argument('--epochs', type=int, default=None,
+                        help='number of epochs the models are fine-tuned for')
+    args = parser.parse_args(argv[2:])
+
+    from bot.trainer import FINE_TUNE_EPOCHS, train_incremental
+
+    for mode in args.modes or list(Mode):
+        logger.info('Running incremental {} training'.format(mode.value))
+        report = train_incremental(mode, args.epochs or FINE_TUNE_EPOCHS)
+        if report is not None:
+            logger.info('Trained {} model for {} epochs in {:.1f}s'.format(
+                mode.value, report.epochs, report.seconds))
+
+elif target == 'tune':
+    # Compares the accuracy and inference latency of classifier architectures
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog='python -m bot tune')
+    parser.add_argument('modes', nargs='*', type=Mode,
+                        help='modes to evaluate (patterns, moods, affections), all by default')
+    parser.add_argument('--sizes', default='16,32,64,128,256,512',
+                        help='comma separated hidden layer sizes')
+    parser.add_argument('--variants', default='dense,bag,linear',
+                        help='comma separated network variants (dense, bag, linear)')
+    parser.add_argument('--folds', type=int, default=5,
+                        help='number of cross-validation folds')
+    parser.add_argument('--output', help='file to write the JSON encoded results to')
+    args = parser.parse_args(argv[2:])
+
+    from bot.setup import VARIANTS
+    from bot.tune import tune
+
+    variants = args.variants.split(',')
+    for variant in variants:
+        if variant not in VARIANTS:
+            parser.error('unknown variant {}'.format(variant))
+    tune(args.modes or list(Mode), [int(size) for size in args.sizes.split(',')],
+         variants, args.folds, args.output)
+
+elif target == 'export-models':
+    # Converts models trained in the legacy Keras format to model artifacts
+    from bot.trainer import export_model
+
+    for mode in Mode:
+        logger.info('Exporting {} model'.format(mode.value))
+        export_model(mode)
+
 elif target == 'train-chat':
     # Trains the chat bots text generator with previously parsed whatsapp chats
     from bot.text_processor.train import train
@@ -35,30 +98,185 @@ elif target == 'train-chat':
     logger.info('Running chat training')
     train()
 
+elif target == 'startup-profile':
+    # Reports the time spent in each phase of the bot's startup
+    from bot.startup import profile_startup
+
+    profile_startup()
+
+elif target == 'bench':
+    # Replays requests through the request handler and reports throughput
+    # and latency per stage
+    from argparse import ArgumentParser
+    from bot.bench import bench
+
+    parser = ArgumentParser(prog='python -m bot bench')
+    parser.add_argument('input', nargs='?',
+                        help='JSONL file with one request per line, synthetic requests if omitted')
+    parser.add_argument('--output', help='file to write the JSON encoded results to')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of synthetic requests')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='how often all requests are replayed')
+    parser.add_argument('--no-generator', action='store_true',
+                        help='skip the text generator, requests without a pattern are '
+                             'counted as skipped and not answered')
+    parser.add_argument('--warm-caches', action='store_true',
+                        help='keep the classification memo and the persistent answer cache '
+                             'filled between repeats and runs')
+    args = parser.parse_args(argv[2:])
+
+    bench(args.input, args.output, args.count, args.repeat, not args.no_generator,
+          args.warm_caches)
+
+elif target == 'load-test':
+    # Starts pools of bot processes like the Go BotPool and measures
+    # throughput, queueing delay, latency and memory for every pool size
+    from argparse import ArgumentParser
+    from bot.load_driver import load_test
+
+    parser = ArgumentParser(prog='python -m bot load-test')
+    parser.add_argument('input', nargs='?',
+                        help='JSONL file with one request per line, synthetic requests if omitted')
+    parser.add_argument('--workers', default='1,2,4',
+                        help='comma separated pool sizes to test')
+    parser.add_argument('--output', help='file to write the JSON encoded results to')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of synthetic requests')
+    parser.add_argument('--generator-share', type=float, default=0.3,
+                        help='share of synthetic requests answered by the generator')
+    parser.add_argument('--concurrency', type=int,
+                        help='number of clients waiting for their answers, the pool size by default')
+    parser.add_argument('--rate', type=float,
+                        help='arrival rate in requests per second instead of waiting clients')
+    parser.add_argument('--bot-args', nargs='*', default=[],
+                        help='additional arguments for the bot processes, e.g. the target')
+    args = parser.parse_args(argv[2:])
+
+    load_test([int(size) for size in args.workers.split(',')], args.input, args.output,
+              args.count, args.generator_share, args.concurrency, args.rate, args.bot_args)
+
+elif target == 'batch':
+    # Answers all requests of a JSONL file at once, e.g. for re-evaluating
+    # the models against logged traffic
+    from argparse import ArgumentParser
+    from bot.batch import CHUNK_SIZE, run_batch
+    from bot.startup import warm_up
+
+    parser = ArgumentParser(prog='python -m bot batch')
+    parser.add_argument('input', help='JSONL file with one request per line')
+    parser.add_argument('output', help='JSONL file the responses are written to')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='number of requests handled at once')
+    parser.add_argument('--no-generator', action='store_true',
+                        help='do not generate answers for requests without a pattern')
+    args = parser.parse_args(argv[2:])
+
+    warm_up(generator=not args.no_generator)
+    run_batch(args.input, args.output, args.chunk_size, not args.no_generator)
+
+elif target == 'memory':
+    # Reports the resident memory of bot processes split into shared and
+    # private memory, by default of a process that has loaded the classifiers
+    import json
+    from argparse import ArgumentParser
+    from bot.memory import format_report, memory_report
+
+    parser = ArgumentParser(prog='python -m bot memory')
+    parser.add_argument('pids', nargs='*', type=int,
+                        help='ids of running bot processes to report')
+    parser.add_argument('--json', action='store_true',
+                        help='print the reports as JSON')
+    args = parser.parse_args(argv[2:])
+
+    if not args.pids:
+        from bot.startup import warm_up
+        warm_up(generator=False)
+
+    reports = [memory_report(pid) for pid in args.pids or ['self']]
+    if None in reports:
+        logger.error('Memory usage is only available on Linux for running processes')
+    reports = [report for report in reports if report is not None]
+    if args.json:
+        print(json.dumps(reports))
+    else:
+        print('\n\n'.join(format_report(report) for report in reports))
+
 elif target == 'demo':
     # Allows developer to test bot in the command line
-    from bot.request_handler import run_demo
-    from bot.model_definitions import Mode
-    from bot.trainer import load_model
+    from bot.startup import warm_up
 
     # Pre-cache models before starting the loop
-    load_model(Mode.PATTERNS)
-    load_model(Mode.MOODS)
-    load_model(Mode.AFFECTIONS)
+    warm_up()
 
+    from bot.request_handler import run_demo
     run_demo()
 
+elif target == 'pipeline':
+    # Runs the request loop with request ids, handling requests concurrently
+    # and writing responses as soon as they are finished
+    from argparse import ArgumentParser
+    from bot.reloader import start_model_watch
+    from bot.startup import warm_up, warm_up_generator_in_background
+
+    parser = ArgumentParser(prog='python -m bot pipeline')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='maximum number of requests handled at the same time')
+    args = parser.parse_args(argv[2:])
+
+    warm_up(generator=False)
+    warm_up_generator_in_background()
+    start_model_watch()
+
+    from bot.pipeline import run_pipelined_loop
+    run_pipelined_loop(args.workers)
+
+elif target == 'batched-loop':
+    # Runs the request loop, handling all requests that are already waiting
+    # on stdin together
+    from argparse import ArgumentParser
+    from bot.reloader import start_model_watch
+    from bot.startup import warm_up, warm_up_generator_in_background
+
+    parser = ArgumentParser(prog='python -m bot batched-loop')
+    parser.add_argument('--max-batch', type=int, default=128,
+                        help='maximum number of requests handled together')
+    args = parser.parse_args(argv[2:])
+
+    warm_up(generator=False)
+    warm_up_generator_in_background()
+    start_model_watch()
+
+    from bot.batched_loop import run_batched_loop
+    run_batched_loop(args.max_batch)
+
+elif target == 'serve':
+    # Runs a pre-fork server that loads the models once and answers requests
+    # on a Unix socket with multiple worker processes
+    from argparse import ArgumentParser
+    from bot.server import run_server
+
+    parser = ArgumentParser(prog='python -m bot serve')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of worker processes')
+    parser.add_argument('--socket', default='bot.sock',
+                        help='path of the Unix socket to listen on')
+    args = parser.parse_args(argv[2:])
+
+    run_server(args.socket, args.workers)
+
 else:
     # The default mode of the bot:
     # Runs a loop waiting for JSON encoded input from stdin and returns
     # JSON encoded output to stdout, seperated by newlines
-    from bot.request_handler import run_loop
-    from bot.model_definitions import Mode
-    from bot.trainer import load_model
+    from bot.reloader import start_model_watch
+    from bot.startup import warm_up, warm_up_generator_in_background
 
-    # Pre-cache models before starting the loop
-    load_model(Mode.PATTERNS)
-    load_model(Mode.MOODS)
-    load_model(Mode.AFFECTIONS)
+    # Pre-cache the classifiers before starting the loop. The generator is
+    # loaded in the background, requests that need it wait until it is ready.
+    warm_up(generator=False)
+    warm_up_generator_in_background()
+    start_model_watch()
 
+    from bot.request_handler import run_loop
     run_loop()
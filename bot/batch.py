@@ -0,0 +1,172 @@
+import json
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+import numpy as np
+
+from bot.classifier import load_fused_classifier
+from bot.data import Request, request_from_dict
+from bot.logger import begin_request, logger
+from bot.model_definitions import AffectionCategory, Mode, MoodCategory, PatternCategory
+from bot.mood_analyzer import adjust_batch
+from bot.pattern_recognizer import PredictionResult, answer_for_pattern, best_predictions
+from bot.preprocessor import PreprocessedMessage, preprocess
+
+# Number of requests read, classified and written at once
+CHUNK_SIZE = 1024
+
+
+def read_chunks(input_file: TextIO, chunk_size: int) -> Iterator[List[str]]:
+    """
+    Reads the non-empty lines of a file in chunks, so only one chunk is kept
+    in memory at a time.
+    """
+    lines = (line for line in input_file if line.strip())
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def error_result(ex: Exception) -> Dict[str, Any]:
+    """
+    Returns the result written for a request that could not be handled.
+    """
+    return {'error': '{}: {}'.format(type(ex).__name__, str(ex))}
+
+
+def process_chunk(lines: List[str], generator: bool) -> List[Dict[str, Any]]:
+    """
+    Handles a chunk of requests at once. All texts are featurized into one
+    matrix that is classified by a single forward pass of the fused
+    classifier, and the error thresholds and the mood and affection
+    adjustment are applied to all rows together. Only requests without a recognized pattern are
+    passed to the text generator, all of them in one call.
+
+    Args:
+        lines: The JSON encoded requests.
+        generator:
+            Whether answers are generated for requests without a pattern.
+            Otherwise their text is None.
+
+    Returns:
+        The response data for every request, in the order of the lines, or
+        an object with an "error" field if the line could not be parsed or
+        its answer could not be created.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(lines)
+    requests: List[Request] = []
+    messages: List[PreprocessedMessage] = []
+    rows: List[int] = []
+    for i, line in enumerate(lines):
+        try:
+            request = request_from_dict(json.loads(line))
+            message = preprocess(request.text)
+        except Exception as ex:
+            results[i] = error_result(ex)
+            continue
+        requests.append(request)
+        messages.append(message)
+        rows.append(i)
+
+    if requests:
+        classifier = load_fused_classifier()
+        input_data = classifier.featurizer.transform_batch(
+            [message.stems for message in messages])
+        probabilities = classifier.predict(input_data)
+        del input_data
+        patterns, pattern_probabilities = best_predictions(
+            probabilities[Mode.PATTERNS], Mode.PATTERNS)
+        moods, mood_probabilities = best_predictions(probabilities[Mode.MOODS], Mode.MOODS)
+        affections, affection_probabilities = best_predictions(
+            probabilities[Mode.AFFECTIONS], Mode.AFFECTIONS)
+
+        mood_values = adjust_batch(
+            np.array([request.mood for request in requests], dtype=np.float64),
+            moods, mood_probabilities, MoodCategory.M_NEG)
+        affection_values = adjust_batch(
+            np.array([request.affection for request in requests], dtype=np.float64),
+            affections, affection_probabilities, AffectionCategory.A_NEG)
+
+        fallback: List[int] = []
+        for j, request in enumerate(requests):
+            begin_request()
+            logger.debug('Handling request: %s', request)
+            response: Dict[str, Any] = {
+                'text': None,
+                'pattern': None,
+                'mood': float(mood_values[j]),
+                'affection': float(affection_values[j]),
+            }
+            if patterns[j] >= 0:
+                result = PredictionResult(
+                    PatternCategory(int(patterns[j])), float(pattern_probabilities[j]))
+                try:
+                    response['pattern'], response['text'] = answer_for_pattern(request, result)
+                except Exception as ex:
+                    response = error_result(ex)
+            else:
+                fallback.append(j)
+            results[rows[j]] = response
+
+        if generator and fallback:
+            from bot.text_processor.generator import generate_answers
+
+            try:
+                answers = generate_answers([messages[j] for j in fallback])
+            except Exception as ex:
+                logger.error('Generating answers failed, generating them separately: {}: {}'.format(
+                    type(ex).__name__, str(ex)))
+                answers = []
+                for j in fallback:
+                    try:
+                        answers.append(generate_answers([messages[j]])[0])
+                    except Exception as ex:
+                        results[rows[j]] = error_result(ex)
+                        answers.append(None)
+            for j, answer in zip(fallback, answers):
+                if answer is not None:
+                    results[rows[j]]['text'] = answer
+
+    return results
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    generator: bool = True
+):
+    """
+    Answers all requests of a JSONL file and writes the responses to another
+    JSONL file, one line per request in the same order. The file is processed
+    in chunks and the progress is logged after every chunk.
+
+    Args:
+        input_path: The file with one JSON encoded request per line.
+        output_path: The file the JSON encoded responses are written to.
+        chunk_size: The number of requests handled at once.
+        generator: Whether answers are generated for requests without a pattern.
+    """
+    counts = {'requests': 0, 'pattern': 0, 'generator': 0, 'error': 0}
+    start = perf_counter()
+    with open(input_path, encoding='utf-8') as input_file, \
+            open(output_path, 'w', encoding='utf-8') as output_file:
+        for lines in read_chunks(input_file, chunk_size):
+            for result in process_chunk(lines, generator):
+                if 'error' in result:
+                    counts['error'] += 1
+                elif result['pattern'] is not None:
+                    counts['pattern'] += 1
+                else:
+                    counts['generator'] += 1
+                output_file.write(json.dumps(result) + '\n')
+            output_file.flush()
+            counts['requests'] += len(lines)
+            elapsed = perf_counter() - start
+            logger.info('Processed {} requests in {:.1f}s ({:.1f} requests/s)'.format(
+                counts['requests'], elapsed, counts['requests'] / elapsed))
+
+    logger.info('Finished batch: {}'.format(json.dumps(counts)))
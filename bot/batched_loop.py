@@ -0,0 +1,152 @@
+import json
+import os
+import select
+import sys
+from typing import List, Optional, Tuple
+
+from bot import metrics
+from bot.data import Request, request_from_dict
+from bot.logger import logger
+from bot.metrics import timed
+from bot.request_handler import handle_command, handle_requests, respond
+
+# Maximum number of bytes read from stdin at once
+READ_SIZE = 65536
+
+
+class LineReader:
+    """
+    Reads lines from a file descriptor and returns all lines that are
+    already available at once, without waiting for more.
+    Relies on select for pipes, so it is only available on POSIX systems.
+    """
+
+    def __init__(self, fd: int):
+        """
+        Args:
+            fd: The file descriptor to read from.
+        """
+        self.fd = fd
+        self.buffer = b''
+        self.eof = False
+
+    def fill(self):
+        chunk = os.read(self.fd, READ_SIZE)
+        if chunk:
+            self.buffer += chunk
+        else:
+            self.eof = True
+
+    def available(self) -> bool:
+        return bool(select.select([self.fd], [], [], 0)[0])
+
+    def read_lines(self, max_lines: int) -> Optional[List[str]]:
+        """
+        Waits until at least one complete line has been received, then reads
+        all further data that is available without waiting.
+
+        Args:
+            max_lines: The maximum number of lines to read before returning.
+
+        Returns:
+            The received lines without line breaks, at most max_lines of
+            them, or None if the end of the input has been reached.
+        """
+        while b'\n' not in self.buffer and not self.eof:
+            self.fill()
+        while not self.eof and self.buffer.count(b'\n') < max_lines and self.available():
+            self.fill()
+
+        lines = self.buffer.split(b'\n')
+        # The last part is an incomplete line, unless the input has ended
+        self.buffer = lines.pop()
+        if self.eof and self.buffer:
+            lines.append(self.buffer)
+            self.buffer = b''
+        if not lines:
+            return None
+        if len(lines) > max_lines:
+            rest = b'\n'.join(lines[max_lines:]) + b'\n'
+            self.buffer = rest + self.buffer
+            lines = lines[:max_lines]
+        return [line.decode('utf-8') for line in lines]
+
+
+def respond_batch(lines: List[str]) -> List[str]:
+    """
+    Handles multiple lines of the line-in/line-out protocol at once. All
+    requests among them are handled together by handle_requests. If that
+    fails, the requests are handled one by one, so an error only affects the
+    request that caused it.
+
+    Args:
+        lines: The JSON encoded requests or control messages.
+
+    Returns:
+        The response for every line in the same order, as written by respond.
+    """
+    outputs: List[Optional[str]] = [None] * len(lines)
+    pending: List[Tuple[int, Request]] = []
+    for i, json_data in enumerate(lines):
+        try:
+            with timed('decode'):
+                data = json.loads(json_data)
+            if 'cmd' in data:
+                metrics.count('commands')
+                outputs[i] = json.dumps(handle_command(data))
+            else:
+                with timed('parse'):
+                    pending.append((i, request_from_dict(data)))
+        except Exception as ex:
+            metrics.count('errors')
+            logger.error('{}: {}'.format(type(ex).__name__, str(ex)))
+            outputs[i] = 'error'
+
+    if pending:
+        metrics.count('batches')
+        try:
+            with timed('batch'):
+                responses = handle_requests([request for _, request in pending])
+            with timed('encode'):
+                for (i, _), response in zip(pending, responses):
+                    outputs[i] = json.dumps(response._asdict())
+            metrics.count('requests', len(pending))
+        except Exception as ex:
+            logger.error('Batch failed, handling requests separately: {}: {}'.format(
+                type(ex).__name__, str(ex)))
+            for i, _ in pending:
+                outputs[i] = respond(lines[i])
+    return outputs
+
+
+def run_batched_loop(max_batch: int):
+    """
+    Starts a request loop with the same protocol as run_loop, which handles
+    all request lines that are already waiting on stdin together. When
+    requests arrive one at a time, every request is handled as soon as it
+    arrives, like in run_loop. During bursts, the waiting requests are
+    classified as one matrix per model and their responses are written in
+    the order the requests arrived.
+
+    Args:
+        max_batch: The maximum number of requests handled together.
+    """
+    logger.info('Starting batched request loop')
+
+    reader = LineReader(sys.stdin.fileno())
+    output_stream = open(sys.stdout.fileno(), 'w', encoding='utf-8', newline='\n',
+                         closefd=False)
+    while True:
+        try:
+            logger.debug('Waiting for request input')
+            lines = reader.read_lines(max_batch)
+            if lines is None:
+                logger.info('EOF detected, aborting request loop')
+                return
+
+            output_stream.write(''.join(output + '\n' for output in respond_batch(lines)))
+            output_stream.flush()
+        except KeyboardInterrupt:
+            # Interrupt requested by developer
+            logger.info('Keyboard interrupt detected, aborting request loop')
+            return
@@ -0,0 +1,239 @@
+import json
+import os
+import random
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bot.data import parse_request
+from bot.logger import logger
+from bot.metrics import timed, trace
+from bot.model_definitions import PatternCategory
+
+# Percentiles reported for every stage
+PERCENTILES = [50, 95, 99]
+
+# Values of the bot used for synthetic requests, as stored by the webserver
+synthetic_bot = {
+    'mood': 0.0,
+    'affection': 0.0,
+    'bot_gender': 1,
+    'bot_name': 'Lana',
+    'bot_birthdate': 812851200,
+    'bot_favorite_color': 'grün',
+    'father_name': 'Georg',
+    'father_age': 49,
+    'mother_name': 'Agathe',
+    'mother_age': 47,
+}
+
+
+def read_requests(file_path: str) -> List[str]:
+    """
+    Reads the requests to replay from a file with one JSON encoded request
+    per line, as sent to the bot by the webserver. Empty lines are skipped.
+
+    Args:
+        file_path: The path of the file.
+
+    Returns:
+        The JSON encoded requests.
+    """
+    with open(file_path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def synthetic_requests(count: int, generator_share: float = 0.3, seed: int = 0) -> List[str]:
+    """
+    Generates requests from the pattern definitions. Most requests are
+    pattern examples, the rest is made of random words taken from all
+    patterns, which are usually answered by the text generator.
+
+    Args:
+        count: The number of requests to generate.
+        generator_share: The share of requests made of random words.
+        seed: The seed of the random generator, so runs can be compared.
+
+    Returns:
+        The JSON encoded requests.
+    """
+    from bot.patterns import patterns_for_category
+
+    rng = random.Random(seed)
+    examples = [pattern for category in PatternCategory
+                if category != PatternCategory.BLACKLIST
+                for pattern in patterns_for_category(category) if pattern]
+    words = [word for pattern in examples for word in pattern.split()]
+
+    requests = []
+    for _ in range(count):
+        if rng.random() < generator_share:
+            text = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 10)))
+        else:
+            text = rng.choice(examples)
+        data = dict(synthetic_bot, text=text,
+                    mood=rng.uniform(-1, 1), affection=rng.uniform(-1, 1))
+        requests.append(json.dumps(data))
+    return requests
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarizes the latencies of a stage.
+
+    Args:
+        seconds: The measured durations in seconds.
+
+    Returns:
+        The count, mean, percentiles and maximum, in milliseconds.
+    """
+    values = np.asarray(seconds) * 1000
+    summary = {'count': len(seconds), 'mean_ms': float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary['p{}_ms'.format(percentile)] = float(value)
+    summary['max_ms'] = float(values.max())
+    return summary
+
+
+def run_benchmark(
+    requests: List[str],
+    repeat: int = 1,
+    generator: bool = True,
+    warm_caches: bool = False
+) -> Dict[str, object]:
+    """
+    Replays the requests through parse_request and handle_request and
+    measures the latency of every request and of the stages it went through.
+
+    Args:
+        requests: The JSON encoded requests.
+        repeat: How often all requests are replayed.
+        generator:
+            Whether requests without a recognized pattern are answered by
+            the text generator. Otherwise they are counted as skipped and
+            the generator is not part of the measured latencies.
+        warm_caches:
+            Whether the classification memo and the answer cache keep their
+            entries. Otherwise both are emptied before every repeat, so the
+            latencies of repeats and runs can be compared.
+
+    Returns:
+        The results: throughput, latency per stage, the share of requests
+        answered by a pattern or the generator or skipped and statistics of
+        the caches.
+    """
+    from bot.pattern_recognizer import classification_memo
+    from bot.request_handler import handle_request
+    from bot.text_processor import generator as text_generator
+
+    stages: Dict[str, List[float]] = {}
+    paths = {'pattern': 0, 'generator': 0, 'skipped': 0, 'error': 0}
+
+    start = perf_counter()
+    for _ in range(repeat):
+        if not warm_caches:
+            classification_memo.clear()
+            if text_generator.resident_cache is not None:
+                text_generator.resident_cache.clear()
+        for json_data in requests:
+            request_start = perf_counter()
+            with trace() as stage_times:
+                try:
+                    with timed('parse'):
+                        request = parse_request(json_data)
+                    response = handle_request(request, use_generator=generator)
+                    if response.pattern is not None:
+                        paths['pattern'] += 1
+                    else:
+                        paths['generator' if generator else 'skipped'] += 1
+                except Exception as ex:
+                    logger.error('{}: {}'.format(type(ex).__name__, str(ex)))
+                    paths['error'] += 1
+                    continue
+            stage_times['total'] = perf_counter() - request_start
+            for stage, seconds in stage_times.items():
+                stages.setdefault(stage, []).append(seconds)
+    duration = perf_counter() - start
+
+    handled = len(requests) * repeat
+    answered = paths['pattern'] + paths['generator'] + paths['skipped']
+    answer_cache = text_generator.resident_cache
+    return {
+        'requests': handled,
+        'seconds': duration,
+        'throughput': handled / duration if duration else 0.0,
+        'paths': paths,
+        'shares': {path: count / answered if answered else 0.0
+                   for path, count in paths.items() if path != 'error'},
+        'stages': {stage: latency_summary(seconds) for stage, seconds in stages.items()},
+        'caches': 'warm' if warm_caches else 'empty per repeat',
+        'classification_memo': classification_memo.stats(),
+        'answer_cache': answer_cache.stats() if answer_cache is not None else None,
+    }
+
+
+def format_results(results: Dict[str, object]) -> str:
+    """
+    Formats benchmark results as a table with one row per stage.
+
+    Args:
+        results: The results returned by run_benchmark.
+
+    Returns:
+        The formatted results.
+    """
+    columns = ['count', 'mean_ms'] + ['p{}_ms'.format(p) for p in PERCENTILES] + ['max_ms']
+    rows = ['{} requests in {:.3f}s, {:.1f} requests/s'.format(
+        results['requests'], results['seconds'], results['throughput'])]
+    rows.append('pattern {:.1%}, generator {:.1%}, skipped {:.1%}, errors {}'.format(
+        results['shares']['pattern'], results['shares']['generator'],
+        results['shares']['skipped'], results['paths']['error']))
+    rows.append('caches: {}'.format(results['caches']))
+    rows.append('{:<24} {}'.format('stage', ' '.join('{:>10}'.format(c) for c in columns)))
+    for stage, summary in sorted(results['stages'].items()):
+        rows.append('{:<24} {:>10} {}'.format(stage, summary['count'], ' '.join(
+            '{:>10.3f}'.format(summary[c]) for c in columns[1:])))
+    return '\n'.join(rows)
+
+
+def bench(
+    input_path: Optional[str],
+    output_path: Optional[str],
+    count: int,
+    repeat: int,
+    generator: bool,
+    warm_caches: bool = False
+):
+    """
+    Runs the benchmark and prints the results. The bot is warmed up before,
+    so loading the models is not part of the measured latencies. Without the
+    generator, the text generator is neither loaded nor called. Unless the
+    caches are kept warm, a temporary answer cache is used instead of the
+    persistent one, so answers of previous runs are not replayed.
+
+    Args:
+        input_path:
+            The JSONL file with the requests to replay, or None for
+            synthetic requests.
+        output_path: The file the JSON encoded results are written to, if any.
+        count: The number of synthetic requests.
+        repeat: How often all requests are replayed.
+        generator: Whether requests without a recognized pattern are answered by the generator.
+        warm_caches: Whether the caches keep their entries between repeats and runs.
+    """
+    from bot.startup import warm_up
+
+    requests = read_requests(input_path) if input_path else synthetic_requests(count)
+    with TemporaryDirectory(prefix='eve-bench-') as cache_dir:
+        if not warm_caches:
+            os.environ['EVE_ANSWER_CACHE'] = path.join(cache_dir, 'answers.sqlite3')
+        warm_up(generator=generator)
+        results = run_benchmark(requests, repeat, generator, warm_caches)
+    results['input'] = input_path or 'synthetic'
+    print(format_results(results))
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
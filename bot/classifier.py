@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bot.dense_network import activations
+from bot.featurizer import Featurizer
+from bot.metrics import timed
+from bot.model_definitions import Mode
+from bot.model_loader import LoadedModel, load_model
+
+
+class FusedClassifier:
+    """
+    Evaluates the pattern, mood and affection models in a single call.
+
+    All models share one input vector built from the union of their
+    vocabularies. The first layers of all models are fused into one kernel,
+    in which every model's first layer kernel is placed at the rows of its
+    own vocabulary and at its own columns of the fused hidden units. The
+    first layers of all models are therefore computed by a single matrix
+    product, which is then split per model for the remaining layers. The
+    results are the same as when the models are run separately.
+    """
+
+    def __init__(self, models: Dict[Mode, LoadedModel]):
+        """
+        Builds the fused classifier from already loaded models.
+
+        Args:
+            models: The loaded model for every mode.
+        """
+        self.models = models
+        total_stems = set()
+        for loaded in models.values():
+            total_stems.update(loaded.total_stems)
+        self.featurizer = Featurizer(sorted(total_stems))
+        # Columns of the fused first layer output of every model
+        self.units: Dict[Mode, slice] = {}
+        kernels = []
+        biases = []
+        offset = 0
+        for mode, loaded in models.items():
+            first = loaded.model.layers[0]
+            rows = np.asarray(self.featurizer.columns(loaded.total_stems), dtype=np.intp)
+            kernel = np.zeros((self.featurizer.size, first.kernel.shape[1]), dtype=np.float32)
+            kernel[rows] = first.kernel
+            kernels.append(kernel)
+            biases.append(first.bias)
+            self.units[mode] = slice(offset, offset + first.kernel.shape[1])
+            offset += first.kernel.shape[1]
+        self.kernel = np.concatenate(kernels, axis=1)
+        self.bias = np.concatenate(biases).astype(np.float32)
+
+    @property
+    def modes(self) -> List[Mode]:
+        return list(self.models)
+
+    def predict(self, input_data: np.ndarray) -> Dict[Mode, np.ndarray]:
+        """
+        Runs all models on the given input.
+
+        Args:
+            input_data:
+                The input matrix, built by the featurizer of this classifier.
+                Every row is classified separately.
+
+        Returns:
+            The probabilities of every category, per mode and input row.
+        """
+        with timed('classify first layers'):
+            hidden = np.dot(input_data, self.kernel)
+            hidden += self.bias
+        probabilities = {}
+        for mode, loaded in self.models.items():
+            with timed('classify {}'.format(mode.value)):
+                network = loaded.model
+                x = activations[network.layers[0].activation](hidden[:, self.units[mode]])
+                probabilities[mode] = network.predict_from(x, 1)
+        return probabilities
+
+
+# Cache for avoiding unnecessary multiple building of the fused classifier
+fused_cache: Optional[FusedClassifier] = None
+
+
+def load_fused_classifier() -> FusedClassifier:
+    """
+    Loads the models of all modes and fuses them into a single classifier.
+    If the classifier has been built before during runtime, the cached
+    classifier will be returned instead.
+
+    Returns:
+        The fused classifier for patterns, moods and affections.
+    """
+    global fused_cache
+    if fused_cache is None:
+        fused_cache = FusedClassifier({mode: load_model(mode) for mode in Mode})
+    return fused_cache
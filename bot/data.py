@@ -76,9 +76,21 @@ def parse_request(json_data: str) -> Request:
     Returns:
         The decoded data as an instance of the Request class.
     """
-    logger.debug('Type: {}'.format(type(json_data)))
-    data = json.loads(json_data)
+    logger.debug('Type: %s', type(json_data))
+    return request_from_dict(json.loads(json_data))
 
+
+def request_from_dict(data: dict) -> Request:
+    """
+    Converts decoded JSON request data to an instance of the Request class.
+    Keys that are not part of the request are ignored.
+
+    Args:
+        data: The decoded request data.
+
+    Returns:
+        The data as an instance of the Request class.
+    """
     return Request(
         data["text"],
         PatternCategory(data["previous_pattern"]
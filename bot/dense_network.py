@@ -0,0 +1,128 @@
+from typing import Callable, Dict, List, NamedTuple
+
+import numpy as np
+
+
+def relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    # Subtracting the maximum avoids overflows and does not change the result
+    x -= x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def linear(x: np.ndarray) -> np.ndarray:
+    return x
+
+
+# Activation functions supported by the NumPy runtime, by their Keras names
+activations: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'relu': relu,
+    'softmax': softmax,
+    'sigmoid': sigmoid,
+    'tanh': np.tanh,
+    'linear': linear,
+}
+
+
+class DenseLayer(NamedTuple):
+    """
+    The weights and activation of a fully connected layer.
+    """
+    kernel: np.ndarray
+    bias: np.ndarray
+    activation: str
+
+
+class DenseNetwork:
+    """
+    NumPy implementation of the forward pass of a sequential model made of
+    Dense layers, as built by bot.setup.setup_nn_model.
+    Dropout layers are not part of the network as they have no effect on
+    inference.
+    """
+
+    def __init__(self, layers: List[DenseLayer]):
+        """
+        Args:
+            layers: The Dense layers of the network, from input to output.
+
+        Raises:
+            ValueError: Raised if a layer uses an unsupported activation.
+        """
+        for layer in layers:
+            if layer.activation not in activations:
+                raise ValueError(
+                    'Unsupported activation {}'.format(layer.activation))
+        self.layers = layers
+
+    @property
+    def input_size(self) -> int:
+        return self.layers[0].kernel.shape[0]
+
+    @property
+    def output_size(self) -> int:
+        return self.layers[-1].kernel.shape[1]
+
+    def predict(self, input_data: np.ndarray) -> np.ndarray:
+        """
+        Runs the forward pass of the network.
+
+        Args:
+            input_data: The input matrix, one row per sample.
+
+        Returns:
+            The output of the last layer, one row per sample.
+        """
+        return self.predict_from(input_data, 0)
+
+    def predict_from(self, x: np.ndarray, start: int) -> np.ndarray:
+        """
+        Runs the forward pass from a layer on, for inputs whose previous
+        layers have already been computed, e.g. by a fused classifier.
+
+        Args:
+            x: The input of the layer at index start, one row per sample.
+            start: The index of the first layer to run.
+
+        Returns:
+            The output of the last layer, one row per sample.
+        """
+        for layer in self.layers[start:]:
+            x = np.dot(x, layer.kernel)
+            x += layer.bias
+            x = activations[layer.activation](x)
+        return x
+
+    @classmethod
+    def from_keras(cls, model) -> 'DenseNetwork':
+        """
+        Extracts the weights of the Dense layers of a Keras model.
+
+        Args:
+            model: The Keras sequential model.
+
+        Returns:
+            The NumPy network equivalent to the model.
+        """
+        layers = []
+        for layer in model.layers:
+            weights = layer.get_weights()
+            if not weights:
+                # Dropout and other layers without weights
+                continue
+            kernel, bias = weights
+            layers.append(DenseLayer(
+                np.asarray(kernel, dtype=np.float32),
+                np.asarray(bias, dtype=np.float32),
+                layer.get_config()['activation']
+            ))
+        return cls(layers)
@@ -0,0 +1,90 @@
+from threading import local
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+
+class Featurizer:
+    """
+    Converts sets of stems to bag-of-words vectors for the vocabulary of a
+    model. Every stem is looked up in a stem to column index, so building a
+    vector only costs as much as the number of stems of the input instead of
+    the size of the vocabulary.
+    """
+
+    def __init__(self, total_stems: List[str], dtype=np.float32):
+        """
+        Args:
+            total_stems: The bag of words used for indexing, i.e. the vocabulary.
+            dtype: The data type of the produced vectors.
+        """
+        self.total_stems = total_stems
+        self.dtype = dtype
+        self.index: Dict[str, int] = {
+            stem: i for i, stem in enumerate(total_stems)}
+        # Preallocated input buffers, one per thread
+        self._local = local()
+
+    @property
+    def size(self) -> int:
+        """
+        The amount of columns of the produced vectors.
+        """
+        return len(self.total_stems)
+
+    def columns(self, stems: Iterable[str]) -> List[int]:
+        """
+        Looks up the columns of the given stems. Stems that are not part of the
+        vocabulary are ignored.
+
+        Args:
+            stems: The stems to look up.
+
+        Returns:
+            The column indices of all known stems.
+        """
+        index = self.index
+        return [index[stem] for stem in stems if stem in index]
+
+    def transform(self, stems: Iterable[str]) -> np.ndarray:
+        """
+        Builds the 1xN input matrix for a single set of stems.
+        The returned matrix is a buffer that is reused by the next call of this
+        method in the same thread, so it has to be consumed (or copied) first.
+
+        Args:
+            stems: The stems of the input text.
+
+        Returns:
+            A 1xN matrix with a 1 in the column of every known stem.
+        """
+        state = self._local
+        buffer = getattr(state, 'buffer', None)
+        if buffer is None:
+            buffer = state.buffer = np.zeros((1, self.size), dtype=self.dtype)
+            state.active = []
+        # Only reset the columns set by the previous call
+        buffer[0, state.active] = 0
+        state.active = self.columns(stems)
+        buffer[0, state.active] = 1
+        return buffer
+
+    def transform_batch(self, stem_sets: Sequence[Iterable[str]]) -> np.ndarray:
+        """
+        Builds the input matrix for multiple sets of stems, one row per set.
+
+        Args:
+            stem_sets: The stems of each input text.
+
+        Returns:
+            A newly allocated MxN matrix, where M is the number of stem sets.
+        """
+        matrix = np.zeros((len(stem_sets), self.size), dtype=self.dtype)
+        rows: List[int] = []
+        cols: List[int] = []
+        for row, stems in enumerate(stem_sets):
+            found = self.columns(stems)
+            rows.extend([row] * len(found))
+            cols.extend(found)
+        matrix[rows, cols] = 1
+        return matrix
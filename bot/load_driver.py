@@ -0,0 +1,331 @@
+import json
+import os
+import random
+import subprocess
+import sys
+from concurrent.futures import Future
+from os import path
+from queue import Queue
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from bot.bench import latency_summary, read_requests, synthetic_requests
+from bot.logger import logger
+from bot.memory import memory_report
+
+# Number of tasks the pool buffers before submitting blocks, as in the Go BotPool
+TASK_BUFFER_SIZE = 128
+
+# Directory the bot processes are started in, i.e. the one containing the bot package
+root_dir = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+class Outcome(NamedTuple):
+    """
+    The result of a single request sent to the pool.
+    """
+    # Seconds the request waited for a free bot process
+    queued: float
+    # Seconds the bot process needed for answering
+    service: float
+    # Whether the bot answered with a valid response
+    ok: bool
+    # Whether the answer was a predefined answer of a pattern
+    pattern: bool
+
+
+class BotProcess:
+    """
+    A bot process started and used like an instance of the Go BotPool: the
+    request is written as a JSON line to stdin and a single response line is
+    read from stdout, which is either a JSON response or the 'error' string.
+    """
+
+    def __init__(self, command: List[str], env: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            command: The command starting the bot, e.g. python -m bot.
+            env: The environment of the bot, the current one if not given.
+        """
+        self.process = subprocess.Popen(
+            command, cwd=root_dir, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def request(self, json_data: str) -> Optional[dict]:
+        """
+        Sends a request and waits for the response.
+
+        Args:
+            json_data: The JSON encoded request.
+
+        Returns:
+            The decoded response, or None if the bot answered with an error
+            or the pipe was closed.
+        """
+        try:
+            self.process.stdin.write((json_data + '\n').encode('utf-8'))
+            self.process.stdin.flush()
+            line = self.process.stdout.readline().decode('utf-8').strip()
+            return json.loads(line)
+        except (OSError, ValueError):
+            # Includes the 'error' sentinel, which is not valid JSON
+            return None
+
+    def close(self):
+        """
+        Closes stdin, which ends the request loop of the bot, and waits for
+        the process to exit.
+        """
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class LoadPool:
+    """
+    Emulates the Go BotPool: requests are put into a bounded task queue and
+    every bot process is driven by a thread that takes the next task as soon
+    as its process is free.
+    """
+
+    def __init__(self, size: int, command: List[str], env: Optional[Dict[str, str]] = None):
+        """
+        Starts the bot processes and waits until every one of them has
+        answered a first request, so startup is not part of the measurements.
+
+        Args:
+            size: The number of bot processes.
+            command: The command starting a bot process.
+            env: The environment of the bot processes, the current one if not given.
+        """
+        start = perf_counter()
+        self.bots = [BotProcess(command, env) for _ in range(size)]
+        warm_up_request = synthetic_requests(1)[0]
+        warm_ups = [Thread(target=bot.request, args=(warm_up_request,)) for bot in self.bots]
+        for thread in warm_ups:
+            thread.start()
+        for thread in warm_ups:
+            thread.join()
+        self.startup_seconds = perf_counter() - start
+
+        self.tasks: Queue = Queue(TASK_BUFFER_SIZE)
+        self.threads = [Thread(target=self.work, args=(bot,), daemon=True) for bot in self.bots]
+        for thread in self.threads:
+            thread.start()
+
+    def work(self, bot: BotProcess):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            json_data, submitted, future = task
+            started = perf_counter()
+            response = bot.request(json_data)
+            future.set_result(Outcome(
+                queued=started - submitted,
+                service=perf_counter() - started,
+                ok=response is not None,
+                pattern=response is not None and response.get('pattern') is not None,
+            ))
+
+    def submit(self, json_data: str) -> Future:
+        """
+        Queues a request for the next free bot process.
+
+        Args:
+            json_data: The JSON encoded request.
+
+        Returns:
+            A future resolving to the outcome of the request.
+        """
+        future: Future = Future()
+        self.tasks.put((json_data, perf_counter(), future))
+        return future
+
+    def memory(self) -> List[Dict[str, int]]:
+        """
+        Returns the memory usage of every bot process, if available.
+        """
+        reports = [memory_report(bot.pid) for bot in self.bots]
+        return [report['total'] for report in reports if report is not None]
+
+    def close(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        for bot in self.bots:
+            bot.close()
+
+
+def closed_loop(pool: LoadPool, requests: Iterator[str], concurrency: int) -> List[Outcome]:
+    """
+    Sends the requests from a fixed number of clients, each of them sending
+    its next request as soon as the previous one has been answered.
+    """
+    outcomes: List[Outcome] = []
+    lock = Lock()
+
+    def client():
+        while True:
+            with lock:
+                json_data = next(requests, None)
+            if json_data is None:
+                return
+            outcome = pool.submit(json_data).result()
+            with lock:
+                outcomes.append(outcome)
+
+    clients = [Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return outcomes
+
+
+def open_loop(pool: LoadPool, requests: Iterator[str], rate: float, seed: int = 0) -> List[Outcome]:
+    """
+    Sends the requests with exponentially distributed gaps, i.e. as a
+    Poisson process with the given rate, independent of how fast they are
+    answered.
+    """
+    rng = random.Random(seed)
+    futures = []
+    next_arrival = perf_counter()
+    for json_data in requests:
+        next_arrival += rng.expovariate(rate)
+        delay = next_arrival - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        futures.append(pool.submit(json_data))
+    return [future.result() for future in futures]
+
+
+def run_load(
+    size: int,
+    requests: List[str],
+    command: List[str],
+    concurrency: int,
+    rate: Optional[float]
+) -> Dict[str, object]:
+    """
+    Starts a pool of the given size, drives it with the requests and
+    measures it. The pool uses an empty temporary answer cache, so its
+    generator requests are not answered by the cache of previous runs.
+
+    Args:
+        size: The number of bot processes.
+        requests: The JSON encoded requests to send.
+        command: The command starting a bot process.
+        concurrency: The number of clients, if no arrival rate is given.
+        rate: The arrival rate in requests per second, or None for clients
+            waiting for their answers.
+
+    Returns:
+        The results for this pool size.
+    """
+    with TemporaryDirectory(prefix='eve-load-') as cache_dir:
+        env = dict(os.environ, EVE_ANSWER_CACHE=path.join(cache_dir, 'answers.sqlite3'))
+        pool = LoadPool(size, command, env)
+        logger.info('Started {} bot processes in {:.3f}s'.format(size, pool.startup_seconds))
+        try:
+            start = perf_counter()
+            if rate:
+                outcomes = open_loop(pool, iter(requests), rate)
+            else:
+                outcomes = closed_loop(pool, iter(requests), concurrency)
+            duration = perf_counter() - start
+            memory = pool.memory()
+        finally:
+            pool.close()
+
+    answered = [outcome for outcome in outcomes if outcome.ok]
+    return {
+        'workers': size,
+        'answer_cache': 'empty per run',
+        'requests': len(outcomes),
+        'errors': len(outcomes) - len(answered),
+        'seconds': duration,
+        'throughput': len(outcomes) / duration if duration else 0.0,
+        'startup_seconds': pool.startup_seconds,
+        'pattern_share': (sum(outcome.pattern for outcome in answered) / len(answered)
+                          if answered else 0.0),
+        'queued': latency_summary([outcome.queued for outcome in outcomes]),
+        'service': latency_summary([outcome.service for outcome in outcomes]),
+        'latency': latency_summary([outcome.queued + outcome.service for outcome in outcomes]),
+        'memory_per_worker': {
+            key: sum(report[key] for report in memory) // len(memory)
+            for key in ['rss', 'pss', 'shared', 'private']
+        } if memory else None,
+    }
+
+
+def format_results(results: List[Dict[str, object]]) -> str:
+    """
+    Formats the results of all pool sizes as a table.
+    """
+    rows = ['Every pool size starts with an empty temporary answer cache']
+    rows += ['{:>7} {:>10} {:>7} {:>12} {:>12} {:>12} {:>12} {:>10} {:>10}'.format(
+        'workers', 'req/s', 'errors', 'queue p50', 'queue p99',
+        'latency p50', 'latency p99', 'pss kB', 'priv kB')]
+    for result in results:
+        memory = result['memory_per_worker'] or {}
+        rows.append((
+            '{:>7} {:>10.1f} {:>7} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.3f} {:>10} {:>10}'
+        ).format(
+            result['workers'], result['throughput'], result['errors'],
+            result['queued']['p50_ms'], result['queued']['p99_ms'],
+            result['latency']['p50_ms'], result['latency']['p99_ms'],
+            memory.get('pss', '-'), memory.get('private', '-')))
+    return '\n'.join(rows)
+
+
+def load_test(
+    sizes: List[int],
+    input_path: Optional[str],
+    output_path: Optional[str],
+    count: int,
+    generator_share: float,
+    concurrency: Optional[int],
+    rate: Optional[float],
+    bot_args: List[str]
+):
+    """
+    Runs the load test for every pool size and prints the results, so the
+    point where adding bot processes stops increasing the throughput can
+    be found.
+
+    Args:
+        sizes: The pool sizes to test.
+        input_path:
+            The JSONL file with the requests to send, or None for synthetic
+            requests.
+        output_path: The file the JSON encoded results are written to, if any.
+        count: The number of synthetic requests.
+        generator_share: The share of synthetic requests made of random words.
+        concurrency:
+            The number of clients waiting for their answers, the pool size
+            if not given.
+        rate: The arrival rate in requests per second, overrides concurrency.
+        bot_args: Additional arguments for python -m bot, e.g. the target.
+    """
+    requests = (read_requests(input_path) if input_path
+                else synthetic_requests(count, generator_share))
+    command = [sys.executable, '-m', 'bot'] + bot_args
+
+    results = []
+    for size in sizes:
+        results.append(run_load(size, requests, command, concurrency or size, rate))
+    print(format_results(results))
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -1,26 +1,136 @@
+import atexit
+import json
 import logging
-from os import path
+import os
+import random
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
 from sys import stderr
+from threading import local
+from typing import List
 
-# setting up the logger for the entire
+# setting up the logger for the entire bot
+#
+# Records are put into a queue by the logging thread and written to the
+# actual handlers by a background thread, so logging never waits for the
+# file or stderr. The logger can be configured per deployment with
+# environment variables:
+#
+# EVE_LOG_LEVEL: the minimum level of records that are logged, INFO by default
+# EVE_LOG_FILE: the log file, {pid} is replaced by the id of the process
+# EVE_LOG_FORMAT: 'text' for the classic format or 'json' for one JSON object per line
+# EVE_LOG_SAMPLE: the share of requests whose debug records are logged, 1 by default
 
-# determines the format of a log entry
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+level_name = os.environ.get('EVE_LOG_LEVEL', 'INFO').upper()
+# Names of unknown levels are mapped to strings like 'Level FOO'
+level = logging.getLevelName(level_name)
+unknown_level = not isinstance(level, int)
+if unknown_level:
+    level = logging.INFO
+log_file = os.environ.get('EVE_LOG_FILE', 'bot.log')
+log_format = os.environ.get('EVE_LOG_FORMAT', 'text')
+sample_rate = float(os.environ.get('EVE_LOG_SAMPLE', '1'))
 
-# setting up the file to which the logs are written
-file_handler = logging.FileHandler('bot.log')
 
-# only debug and more severe logs are written to the log file
-file_handler.setLevel(logging.INFO)
+class JsonFormatter(logging.Formatter):
+    """
+    Formats every record as a single line JSON object.
+    """
 
-# adding the formatter to the logger
-file_handler.setFormatter(formatter)
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'pid': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
 
-# adding console output to the logger for debug purposes in the console demo
-stream_handler = logging.StreamHandler(stream=stderr)
-stream_handler.setLevel(logging.DEBUG)
-stream_handler.setFormatter(formatter)
 
-logger = logging.Logger('EVE')
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+# Whether the debug records of the request handled by the current thread are logged
+current = local()
+sample_random = random.Random()
+
+
+def begin_request():
+    """
+    Decides whether the debug records of the request that is handled next by
+    the current thread are logged, according to the sample rate. The
+    decision applies to all debug records of the thread until the next
+    request begins.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        current.sampled = sample_rate >= 1 or sample_random.random() < sample_rate
+
+
+class SampleFilter(logging.Filter):
+    """
+    Drops the debug records of requests that were not sampled. Records that
+    are logged outside of requests are never dropped.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or getattr(current, 'sampled', True)
+
+
+def create_handlers() -> List[logging.Handler]:
+    """
+    Creates the handlers that write the records, used by the background thread.
+    """
+    # determines the format of a log entry
+    if log_format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    # setting up the file to which the logs are written
+    file_handler = logging.FileHandler(log_file.format(pid=os.getpid()), encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    # adding console output to the logger for debug purposes in the console demo
+    stream_handler = logging.StreamHandler(stream=stderr)
+    stream_handler.setFormatter(formatter)
+    return [file_handler, stream_handler]
+
+
+logger = logging.Logger('EVE', level)
+queue_handler = QueueHandler(Queue())
+queue_handler.addFilter(SampleFilter())
+logger.addHandler(queue_handler)
+
+listener = QueueListener(queue_handler.queue, *create_handlers())
+listener.start()
+
+if unknown_level:
+    logger.warning('Unknown EVE_LOG_LEVEL %s, logging at %s level',
+                   level_name, logging.getLevelName(level))
+
+
+def stop_logging():
+    """
+    Writes all queued records and stops the background thread.
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+def restart_logging():
+    """
+    Restarts the background thread in a forked process, as threads do not
+    survive a fork. The process gets its own log file if the file name
+    contains its id.
+    """
+    global listener
+    queue_handler.queue = Queue()
+    listener = QueueListener(queue_handler.queue, *create_handlers())
+    listener.start()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable
+
+# Returned by LRUCache.get for keys that are not cached, as None is a valid value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe mapping with a bounded size that evicts the least recently
+    used entry when it is full, and counts hits and misses.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Args:
+            max_size: The maximum number of entries.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Looks up the value for a key and marks the entry as recently used.
+
+        Args:
+            key: The key to look up.
+
+        Returns:
+            The cached value, or MISSING if the key is not cached.
+        """
+        with self._lock:
+            value = self._entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores the value for a key, evicting the least recently used entry if
+        the cache is full.
+
+        Args:
+            key: The key to store the value for.
+            value: The value to store.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the counters and the current size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
@@ -0,0 +1,99 @@
+import os
+from typing import Dict, Optional, Union
+
+# Fields of /proc/<pid>/smaps that are included in the report, all in kB
+SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+    'Swap': 'swap',
+}
+
+
+def summarize(counters: Dict[str, int]) -> Dict[str, int]:
+    """
+    Adds the total shared and private memory to the counters of a mapping.
+    """
+    counters['shared'] = counters['shared_clean'] + counters['shared_dirty']
+    counters['private'] = counters['private_clean'] + counters['private_dirty']
+    return counters
+
+
+def memory_report(
+    pid: Union[int, str] = 'self',
+    mapped_suffix: str = '.model'
+) -> Optional[Dict[str, object]]:
+    """
+    Reports the resident memory of a process, split into memory that is
+    shared with other processes and memory that is private to the process.
+    Memory mapped files ending with the given suffix, i.e. the model
+    artifacts, are also reported separately, so it can be checked that their
+    weights are actually shared between the bot processes.
+
+    Only available on Linux, as it reads /proc/<pid>/smaps.
+
+    Args:
+        pid: The process id, the current process by default.
+        mapped_suffix: The suffix of the mapped files to report separately.
+
+    Returns:
+        The counters in kB for the whole process (rss, pss, shared, private
+        and their clean and dirty parts, swap) and per matching mapped file,
+        or None if the memory usage of the process can not be read.
+    """
+    total = {name: 0 for name in SMAPS_FIELDS.values()}
+    files: Dict[str, Dict[str, int]] = {}
+    current = None
+    try:
+        with open('/proc/{}/smaps'.format(pid)) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in SMAPS_FIELDS:
+                    size = int(value.split()[0])
+                    total[SMAPS_FIELDS[key]] += size
+                    if current is not None:
+                        current[SMAPS_FIELDS[key]] += size
+                elif '-' in key and ' ' in line:
+                    # Header line of the next mapping:
+                    # address perms offset dev inode [pathname]
+                    parts = line.split(None, 5)
+                    pathname = parts[5].strip() if len(parts) > 5 else ''
+                    current = None
+                    # Replaced artifacts stay mapped until they are released
+                    if pathname.replace(' (deleted)', '').endswith(mapped_suffix):
+                        current = files.setdefault(
+                            pathname, {name: 0 for name in SMAPS_FIELDS.values()})
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return {
+        'pid': os.getpid() if pid == 'self' else int(pid),
+        'total': summarize(total),
+        'mapped_files': {name: summarize(counters) for name, counters in files.items()},
+    }
+
+
+def format_report(report: Dict[str, object]) -> str:
+    """
+    Formats a memory report as a table, one row for the whole process and
+    one per mapped file.
+
+    Args:
+        report: A report returned by memory_report.
+
+    Returns:
+        The table, with all values in kB.
+    """
+    columns = ['rss', 'pss', 'shared', 'private', 'swap']
+    rows = ['{:<40} {}'.format(
+        'pid {}'.format(report['pid']), ' '.join('{:>10}'.format(c) for c in columns))]
+    entries = [('total', report['total'])] + [
+        (os.path.basename(name), counters)
+        for name, counters in sorted(report['mapped_files'].items())]
+    for name, counters in entries:
+        rows.append('{:<40} {}'.format(
+            name, ' '.join('{:>10}'.format(counters[c]) for c in columns)))
+    return '\n'.join(rows)
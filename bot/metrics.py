@@ -0,0 +1,140 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter, time
+from typing import Deque, Dict, Iterator
+
+import numpy as np
+
+# Number of most recent durations kept per stage for computing percentiles
+WINDOW_SIZE = 1024
+
+# Percentiles included in snapshots
+PERCENTILES = [50, 95, 99]
+
+# Per-thread trace of the request that is currently handled
+current = local()
+
+# Time the metrics of this process were started
+started = time()
+
+
+class StageHistogram:
+    """
+    Rolling latency statistics of a single stage. The total count and time
+    cover the whole lifetime of the process, percentiles only the most
+    recent durations.
+    """
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.count = 0
+        self.total = 0.0
+        self.recent: Deque[float] = deque(maxlen=window_size)
+        self._lock = Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.recent.append(seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Returns the count, the total and mean time and the percentiles of the
+        recent durations, in milliseconds.
+        """
+        with self._lock:
+            count, total, recent = self.count, self.total, list(self.recent)
+        summary = {
+            'count': count,
+            'total_ms': total * 1000,
+            'mean_ms': total * 1000 / count if count else 0.0,
+        }
+        if recent:
+            values = np.percentile(np.asarray(recent) * 1000, PERCENTILES)
+            for percentile, value in zip(PERCENTILES, values):
+                summary['p{}_ms'.format(percentile)] = float(value)
+        return summary
+
+
+histograms: Dict[str, StageHistogram] = {}
+counters: Dict[str, int] = {}
+registry_lock = Lock()
+
+
+def histogram(stage: str) -> StageHistogram:
+    """
+    Returns the histogram of a stage, creating it on first use.
+    """
+    stage_histogram = histograms.get(stage)
+    if stage_histogram is None:
+        with registry_lock:
+            stage_histogram = histograms.setdefault(stage, StageHistogram())
+    return stage_histogram
+
+
+def count(name: str, amount: int = 1):
+    """
+    Increases a counter of this process.
+
+    Args:
+        name: The name of the counter.
+        amount: The amount to add.
+    """
+    with registry_lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Measures the time spent in a stage of the request handling and adds it
+    to the rolling histogram of the stage. If a trace is active in the
+    current thread, the time is added to it as well.
+
+    Args:
+        stage: The name of the stage.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        histogram(stage).add(elapsed)
+        stages = getattr(current, 'stages', None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def trace() -> Iterator[Dict[str, float]]:
+    """
+    Collects the time spent in every stage while handling a request in the
+    current thread.
+
+    Returns:
+        The seconds spent per stage, filled in when the block exits.
+    """
+    previous = getattr(current, 'stages', None)
+    stages: Dict[str, float] = {}
+    current.stages = stages
+    try:
+        yield stages
+    finally:
+        current.stages = previous
+
+
+def snapshot() -> Dict[str, object]:
+    """
+    Returns the current counters and the latency statistics of all stages
+    measured in this process.
+    """
+    with registry_lock:
+        stage_histograms = dict(histograms)
+        counter_values = dict(counters)
+    return {
+        'uptime_seconds': time() - started,
+        'counters': counter_values,
+        'stages': {stage: stage_histogram.snapshot()
+                   for stage, stage_histogram in sorted(stage_histograms.items())},
+    }
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import mmap
+import struct
+from os import path, replace
+from time import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from bot.dense_network import DenseLayer, DenseNetwork
+from bot.model_definitions import Mode
+
+# Identifies model artifact files
+MAGIC = b'EVEMODEL'
+# Version of the layout described in save_artifact
+FORMAT_VERSION = 1
+# Alignment of the vocabulary and all arrays, in bytes
+ALIGNMENT = 64
+# Byte order and type of all stored arrays
+DTYPE = np.dtype('<f4')
+
+
+class ModelArtifact(NamedTuple):
+    """
+    The contents of a model artifact file.
+    """
+    header: Dict[str, Any]
+    network: DenseNetwork
+    total_stems: List[str]
+
+
+def artifact_path(models_dir: str, mode: Mode) -> str:
+    """
+    Returns the path of the model artifact for the specified mode.
+
+    Args:
+        models_dir: The models directory.
+        mode: The mode of the model.
+
+    Returns:
+        The path of the artifact in the models directory.
+    """
+    return path.join(models_dir, '%s.model' % mode.value)
+
+
+def vocabulary_hash(vocabulary: bytes) -> str:
+    return hashlib.sha256(vocabulary).hexdigest()
+
+
+def aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def read_header(file_path: str) -> Dict[str, Any]:
+    """
+    Reads only the header of a model artifact.
+
+    Args:
+        file_path: The path of the artifact.
+
+    Raises:
+        ValueError: Raised if the file is not a model artifact.
+
+    Returns:
+        The decoded header.
+    """
+    with open(file_path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a model artifact')
+        header_length, = struct.unpack('<I', prefix[len(MAGIC):])
+        return json.loads(f.read(header_length).decode('utf-8'))
+
+
+def save_artifact(
+    file_path: str,
+    mode: Mode,
+    network: DenseNetwork,
+    total_stems: List[str],
+    extra: Optional[Dict[str, Any]] = None
+):
+    """
+    Saves a trained network and its vocabulary as a single model artifact.
+
+    The file starts with the magic bytes and the length of the header,
+    followed by the JSON encoded header. It contains the format version, the
+    mode, the class list, the hash of the vocabulary, a model version that is
+    increased whenever an artifact is replaced, and the location of the
+    vocabulary and every weight array. These follow the header as a data
+    section: the vocabulary as newline separated UTF-8 stems, then the
+    kernel and bias of every layer as contiguous little-endian float32
+    arrays. All offsets are relative to the data section, which starts at the
+    first aligned offset after the header, and every part of it is aligned
+    so that the arrays can be used directly from a memory mapped file.
+
+    The artifact is written to a temporary file first and then moved into
+    place, so readers never see a partially written artifact.
+
+    Args:
+        file_path: The path of the artifact to write.
+        mode: The mode of the model.
+        network: The trained network.
+        total_stems: The bag of words used for indexing the input.
+        extra: Additional values stored in the header.
+    """
+    model_version = 1
+    if path.isfile(file_path):
+        try:
+            model_version = read_header(file_path).get('model_version', 0) + 1
+        except ValueError:
+            pass
+
+    vocabulary = '\n'.join(total_stems).encode('utf-8')
+    sections: List[bytes] = []
+    offset = 0
+
+    def add_section(data: bytes) -> Dict[str, int]:
+        nonlocal offset
+        start = aligned(offset)
+        sections.append(b'\0' * (start - offset))
+        sections.append(data)
+        offset = start + len(data)
+        return {'offset': start, 'length': len(data)}
+
+    def add_array(array: np.ndarray) -> Dict[str, Any]:
+        array = np.ascontiguousarray(array, dtype=DTYPE)
+        location = add_section(array.tobytes())
+        location['shape'] = list(array.shape)
+        return location
+
+    vocabulary_location = add_section(vocabulary)
+    vocabulary_location['count'] = len(total_stems)
+    layers = [{
+        'activation': layer.activation,
+        'kernel': add_array(layer.kernel),
+        'bias': add_array(layer.bias),
+    } for layer in network.layers]
+
+    header = dict(extra or {})
+    header.update({
+        'format_version': FORMAT_VERSION,
+        'mode': mode.value,
+        'model_version': model_version,
+        'created': time(),
+        'classes': [category.name for category in mode.category_type],
+        'vocabulary_hash': vocabulary_hash(vocabulary),
+        'vocabulary': vocabulary_location,
+        'dtype': DTYPE.str,
+        'layers': layers,
+    })
+    encoded_header = json.dumps(header).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(encoded_header)) + encoded_header
+    data_start = aligned(len(prefix))
+
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(prefix)
+        f.write(b'\0' * (data_start - len(prefix)))
+        for section in sections:
+            f.write(section)
+    replace(temp_path, file_path)
+
+
+def parse_artifact(buffer, mode: Mode) -> ModelArtifact:
+    """
+    Decodes a model artifact from a buffer without copying the weights.
+
+    Args:
+        buffer: The contents of the artifact, e.g. bytes or a memory map.
+        mode: The mode the artifact is expected to belong to.
+
+    Raises:
+        ValueError:
+            Raised if the buffer is not a valid artifact of a supported format
+            version, belongs to another mode or does not match the categories
+            of the mode.
+
+    Returns:
+        The decoded artifact. Its arrays are read-only views of the buffer.
+    """
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not a model artifact')
+    header_start = len(MAGIC) + 4
+    header_length, = struct.unpack('<I', view[len(MAGIC):header_start])
+    header = json.loads(bytes(view[header_start:header_start + header_length]).decode('utf-8'))
+    data_start = aligned(header_start + header_length)
+
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ValueError('Unsupported model artifact version {}'.format(
+            header.get('format_version')))
+    if header['mode'] != mode.value:
+        raise ValueError('Model artifact belongs to mode {}'.format(header['mode']))
+    classes = [category.name for category in mode.category_type]
+    if header['classes'] != classes:
+        raise ValueError('Model artifact classes do not match the {} categories'.format(
+            mode.value))
+
+    def section(location: Dict[str, Any]) -> memoryview:
+        start = data_start + location['offset']
+        return view[start:start + location['length']]
+
+    vocabulary = bytes(section(header['vocabulary']))
+    if vocabulary_hash(vocabulary) != header['vocabulary_hash']:
+        raise ValueError('Model artifact vocabulary is corrupted')
+    total_stems = vocabulary.decode('utf-8').split('\n') if vocabulary else []
+
+    dtype = np.dtype(header['dtype'])
+
+    def array(location: Dict[str, Any]) -> np.ndarray:
+        return np.frombuffer(section(location), dtype=dtype).reshape(location['shape'])
+
+    network = DenseNetwork([
+        DenseLayer(array(layer['kernel']), array(layer['bias']), layer['activation'])
+        for layer in header['layers']
+    ])
+    return ModelArtifact(header, network, total_stems)
+
+
+def load_artifact(file_path: str, mode: Mode) -> ModelArtifact:
+    """
+    Loads a model artifact with a single sequential read.
+
+    Args:
+        file_path: The path of the artifact.
+        mode: The mode the artifact is expected to belong to.
+
+    Returns:
+        The decoded artifact.
+    """
+    with open(file_path, 'rb') as f:
+        return parse_artifact(f.read(), mode)
+
+
+def map_artifact(file_path: str, mode: Mode) -> ModelArtifact:
+    """
+    Loads a model artifact by mapping the file read-only into memory.
+    The weights are used directly from the page cache, so all processes on a
+    host that map the same artifact share a single copy of them. Pages are
+    only read from disk when they are first accessed.
+
+    The mapping stays valid when the artifact is replaced, as save_artifact
+    moves a new file into place instead of writing to the existing one.
+
+    Args:
+        file_path: The path of the artifact.
+        mode: The mode the artifact is expected to belong to.
+
+    Returns:
+        The decoded artifact. Its arrays are read-only views of the mapping,
+        which is kept open as long as they are referenced.
+    """
+    with open(file_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return parse_artifact(mapped, mode)
+
+
+def save_training_data(file_path: str, train_x: np.ndarray, train_y: np.ndarray):
+    """
+    Saves the training matrices separately from the model artifact, as they
+    are not needed for inference.
+
+    Args:
+        file_path: The path of the archive to write.
+        train_x: The feature parameters.
+        train_y: The label parameters.
+    """
+    with open(file_path, 'wb') as f:
+        np.savez_compressed(f, train_x=train_x, train_y=train_y)
@@ -0,0 +1,155 @@
+import pickle
+from os import path, mkdir, stat
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from bot.dense_network import DenseNetwork
+from bot.featurizer import Featurizer
+from bot.logger import logger
+from bot.model_artifact import artifact_path, map_artifact
+from bot.model_definitions import Mode
+
+
+def setup_models_dir() -> str:
+    """
+    Creates the models directory if it does not exist
+
+    Returns:
+        The path to the models directory.
+    """
+    dir = path.join(path.dirname(__file__), 'models')
+    if not path.exists(dir):
+        mkdir(dir)
+    if not path.isdir(dir):
+        raise Exception('Models path is not a directory: {}'.format(dir))
+    return dir
+
+
+dir = setup_models_dir()
+
+
+class LoadedModel(NamedTuple):
+    """
+    A pre-trained model together with the data needed for running it.
+    """
+    model: DenseNetwork
+    total_stems: List[str]
+    featurizer: Featurizer
+    # Increases whenever new weights are loaded, used to invalidate cached results
+    version: int
+    # Identifies the artifact file the model was loaded from, None for legacy models
+    signature: Optional[Tuple[int, int, int]]
+
+
+def model_path(mode: Mode) -> str:
+    """
+    Returns the path of the model artifact for the specified mode.
+
+    Args:
+        mode: The mode of the model.
+
+    Returns:
+        The path of the artifact in the models directory.
+    """
+    return artifact_path(dir, mode)
+
+
+def artifact_signature(mode: Mode) -> Optional[Tuple[int, int, int]]:
+    """
+    Identifies the artifact file that is currently in place for a mode,
+    without reading it. Replacing the artifact changes its signature.
+
+    Args:
+        mode: The mode of the model.
+
+    Returns:
+        The inode, modification time and size of the artifact, or None if
+        there is no artifact.
+    """
+    try:
+        result = stat(model_path(mode))
+    except FileNotFoundError:
+        return None
+    return result.st_ino, result.st_mtime_ns, result.st_size
+
+
+def load_keras_model(mode: Mode) -> Tuple[DenseNetwork, List[str]]:
+    """
+    Loads a model saved in the legacy Keras format, i.e. the model JSON, the
+    HDF5 weights and the pickled TrainingData, and converts it to a NumPy
+    network. Keras is only imported by this function, so processes that only
+    use model artifacts never import it.
+
+    Args:
+        mode: The mode to load the model for.
+
+    Returns:
+        The converted network and the list of total stems used for indexing
+        its input.
+    """
+    from keras.models import model_from_json
+
+    file_name: str = mode.value
+    with open(path.join(dir, '%s.dump' % file_name), 'rb') as f:
+        data = pickle.load(f)
+
+    with open(path.join(dir, '%s-model.json' % file_name)) as f:
+        model = model_from_json(f.read())
+
+    model.load_weights(path.join(dir, '%s-weights.h5' % file_name))
+
+    return DenseNetwork.from_keras(model), data.total_stems
+
+
+# Cache for avoiding unnecessary multiple loading of models
+model_cache: Dict[Mode, LoadedModel] = {}
+
+# Version assigned to the most recently loaded model
+model_version = 0
+
+
+def read_model(mode: Mode) -> LoadedModel:
+    """
+    Loads a pre-trained model from disk, bypassing the cache. The model
+    artifact is memory mapped if available, so its weights are shared by all
+    bot processes on the host, otherwise the model is converted from the
+    legacy Keras format.
+
+    Args:
+        mode: The mode to load the model for.
+
+    Returns:
+        A pre-trained network loaded from disk, the list of total stems used,
+        the featurizer for the model's vocabulary, the version of the loaded
+        weights and the signature of the artifact.
+    """
+    global model_version
+
+    signature = artifact_signature(mode)
+    if signature is not None:
+        artifact = map_artifact(model_path(mode), mode)
+        network, total_stems = artifact.network, artifact.total_stems
+    else:
+        logger.warning(
+            'No model artifact found for {}, loading Keras model'.format(mode))
+        network, total_stems = load_keras_model(mode)
+
+    model_version += 1
+    return LoadedModel(
+        network, total_stems, Featurizer(total_stems), model_version, signature)
+
+
+def load_model(mode: Mode) -> LoadedModel:
+    """
+    Loads a pre-trained model from disk using read_model.
+    If the model has been loaded before during runtime, the cached model
+    will be returned instead.
+
+    Args:
+        mode: The mode to load the model for.
+
+    Returns:
+        The loaded model.
+    """
+    if mode not in model_cache:
+        model_cache[mode] = read_model(mode)
+    return model_cache[mode]
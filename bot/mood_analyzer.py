@@ -1,9 +1,11 @@
 from math import tanh
-from typing import Tuple
+from typing import Optional, Tuple
+
+import numpy as np
 
 from bot.data import Request
-from bot.model_definitions import Mode, MoodCategory, AffectionCategory
-from bot.pattern_recognizer import analyze_input
+from bot.model_definitions import Category, MoodCategory, AffectionCategory
+from bot.pattern_recognizer import PredictionResult
 from bot.logger import logger
 
 # factor 0.2 ensures steady adjustment of bots mood and affection
@@ -25,28 +27,33 @@ def stretch_prob(probability: float) -> float:
     return 4 * probability - 3
 
 
-def analyze(request: Request) -> Tuple[float, float]:
+def analyze(
+    request: Request,
+    mood_result: Optional[PredictionResult],
+    affection_result: Optional[PredictionResult]
+) -> Tuple[float, float]:
     """
     Args:
         request:
             The request passed by the web server to the bot instance.
             It contains all the necessary information to determine a new bot mood/affection.
+        mood_result:
+            The mood estimated by the neural network for the text of the
+            request, or None if no mood was recognized.
+        affection_result:
+            The affection estimated by the neural network for the text of the
+            request, or None if no affection was recognized.
 
     Returns:
         The new mood/affection of the bot calculated on the text of the message and the
         previous mood and affection
     """
-    # input message of the user passed by a request
-    text = request.text
-
     # Inits bots mood. It stays unchanged if the message does not contain certain signs of specificly
     # positive or negative mood.
     mood_bot = request.mood
 
-    # Estimate mood through the neural network
-    mood_result = analyze_input(text, Mode.MOODS)
     if mood_result:
-        logger.debug('Affection: {}'.format(mood_result.category.name))
+        logger.debug('Mood: %s', mood_result.category.name)
         mood_probability = mood_result.probability
         # checking for a negative or positive mood
         if mood_result.category == MoodCategory.M_NEG:
@@ -66,10 +73,8 @@ def analyze(request: Request) -> Tuple[float, float]:
     # positive or negative affection.
     affection_bot = request.affection
 
-    # Estimate mood through the neural network
-    affection_result = analyze_input(text, Mode.AFFECTIONS)
     if affection_result:
-        logger.debug('Affection: {}'.format(affection_result.category.name))
+        logger.debug('Affection: %s', affection_result.category.name)
         affection_probability = affection_result.probability
 
         # checking for a negative or positive affection
@@ -88,3 +93,31 @@ def analyze(request: Request) -> Tuple[float, float]:
         affection_bot = tanh(2 * affection_bot)
 
     return (mood_bot, affection_bot)
+
+
+def adjust_batch(
+    values: np.ndarray,
+    categories: np.ndarray,
+    probabilities: np.ndarray,
+    negative: Category
+) -> np.ndarray:
+    """
+    Vectorized form of the mood and affection adjustment done by analyze,
+    for many requests at once.
+
+    Args:
+        values: The current mood or affection of the bot for every request.
+        categories:
+            The index of the recognized mood or affection category for every
+            request, or -1 if none was recognized.
+        probabilities: The probability of the recognized category.
+        negative: The category that decreases the value.
+
+    Returns:
+        The new mood or affection for every request. Values of requests
+        without a recognized category stay unchanged.
+    """
+    sign = np.where(categories == negative.value, -1.0, 1.0)
+    adjusted = values + sign * stretch_prob(probabilities.astype(np.float64)) * IMPACT_FACTOR
+    adjusted = np.tanh(2 * np.minimum(adjusted, 1.0))
+    return np.where(categories >= 0, adjusted, values)
@@ -1,22 +1,23 @@
 from datetime import date
 from enum import IntEnum
 from os import path
-from typing import Optional, NamedTuple, Generic, TypeVar, Tuple, Dict
+from typing import Optional, NamedTuple, Generic, TypeVar, Tuple, Dict, FrozenSet, Hashable, List
 
-import nltk
 import numpy as np
-from nltk.stem.snowball import GermanStemmer
 
+from bot.classifier import load_fused_classifier
 from bot.model_definitions import Mode, Category, PatternCategory
 from bot.data import Request, Gender
 from bot.logger import logger
+from bot.lru_cache import LRUCache, MISSING
+from bot.preprocessor import PreprocessedMessage, preprocess
 from bot.static_answers import get_static_answer
-from bot.trainer import load_model
+from bot.model_loader import LoadedModel, load_model
 
 dir = path.dirname(__file__)
 
-# Create German snowball stemmer
-stemmer = GermanStemmer()
+# Maximum number of memoized classification results
+MEMO_SIZE = 4096
 
 
 class PredictionResult(NamedTuple):
@@ -27,60 +28,196 @@ class PredictionResult(NamedTuple):
     probability: float  # 1 equals 100% probability
 
 
-def analyze_input(text: str, mode: Mode) -> Optional[PredictionResult]:
+# Memoized classification results. Results only depend on the mode, the
+# stems known to the model and its weights, which form the key.
+classification_memo = LRUCache(MEMO_SIZE)
+
+
+def memo_key(mode: Mode, loaded: LoadedModel, stems: List[str]) -> Hashable:
     """
-    Scans the supplied request for pre-defined patterns.
+    Builds the key for memoizing the classification of a message.
 
     Args:
-        request: The request to scan for patterns.
+        mode: The mode of the classification.
+        loaded: The model used for the classification.
+        stems: The stems of the message.
+
+    Returns:
+        A key made of the mode, the set of stems known to the model and the
+        version of the model. Unknown stems are left out as they do not
+        change the result.
+    """
+    index = loaded.featurizer.index
+    known: FrozenSet[str] = frozenset(stem for stem in stems if stem in index)
+    return mode, known, loaded.version
+
+
+def analyze_input(message: PreprocessedMessage, mode: Mode) -> Optional[PredictionResult]:
+    """
+    Scans the supplied message for pre-defined patterns.
+
+    Args:
+        message: The preprocessed message to scan for patterns.
+        mode: The mode to run the pattern recognizer in.
 
     Returns:
         The category of the recognized pattern or None if none was found.
     """
     # Load model and data
-    model, data = load_model(mode)
-    # Tokenize pattern
-    words = nltk.word_tokenize(text)
-    stems = [stemmer.stem(word.lower()) for word in words]
-    total_stems = data.total_stems
-    bag = [0] * len(total_stems)
-    for stem in stems:
-        for i, s in enumerate(total_stems):
-            if s == stem:
-                bag[i] = 1
+    loaded = load_model(mode)
+    key = memo_key(mode, loaded, message.stems)
+    result = classification_memo.get(key)
+    if result is not MISSING:
+        return result
 
     # Convert to matrix
-    input_data = np.asarray([bag])
+    input_data = loaded.featurizer.transform(message.stems)
 
     # Predict category
-    results = model.predict(input_data)[0]
-    lower_bound = 0 if mode == Mode.PATTERNS else -1
+    result = prediction_result(loaded.model.predict(input_data)[0], mode)
+    classification_memo.put(key, result)
+    return result
 
-    CategoryType = mode.category_type
 
-    results = [PredictionResult(CategoryType(i), p) for i, p in enumerate(results)
-               if i > lower_bound]
-    results.sort(key=lambda result: result.probability, reverse=True)
+def classify(message: PreprocessedMessage) -> Dict[Mode, Optional[PredictionResult]]:
+    """
+    Scans the supplied message for patterns, moods and affections at once,
+    using a single forward pass of the fused classifier. Memoized results
+    are used if all modes have been classified for the same stems before.
+
+    Args:
+        message: The preprocessed message to classify.
+
+    Returns:
+        The recognized category for every mode, or None for modes where no
+        category passed the error threshold.
+    """
+    classifier = load_fused_classifier()
+    keys = {mode: memo_key(mode, loaded, message.stems)
+            for mode, loaded in classifier.models.items()}
+    results = {mode: classification_memo.get(key) for mode, key in keys.items()}
+    if all(result is not MISSING for result in results.values()):
+        return results
+
+    input_data = classifier.featurizer.transform(message.stems)
+    probabilities = classifier.predict(input_data)
+    for mode, mode_probabilities in probabilities.items():
+        results[mode] = prediction_result(mode_probabilities[0], mode)
+        classification_memo.put(keys[mode], results[mode])
+    return results
 
-    # Log all results to debug the percentages
-    logger.debug('Results: {}'.format(results))
 
-    error_threshold = 0.9
+def error_threshold(mode: Mode) -> float:
+    """
+    Returns the probability the most probable category of a mode has to
+    exceed to be recognized.
+    """
     if mode == Mode.MOODS or mode == Mode.AFFECTIONS:
         # Sentiment analysis should be less sensitive than pattern recognition
         # as false-positives don't have as big of an impact and real persons
         # are more likely to misinterprete the mood or affection of a sentence
         # as well.
-        error_threshold = 0.75
+        return 0.75
+    return 0.9
+
+
+def classify_batch(
+    messages: List[PreprocessedMessage]
+) -> List[Dict[Mode, Optional[PredictionResult]]]:
+    """
+    Classifies many messages at once. Messages that are not fully memoized
+    are classified together, using a single forward pass of the fused
+    classifier over one input matrix.
+
+    Args:
+        messages: The preprocessed messages to classify.
+
+    Returns:
+        The recognized category for every mode, per message.
+    """
+    classifier = load_fused_classifier()
+    keys = [{mode: memo_key(mode, loaded, message.stems)
+             for mode, loaded in classifier.models.items()} for message in messages]
+    results = [{mode: classification_memo.get(key) for mode, key in message_keys.items()}
+               for message_keys in keys]
+    missing = [i for i, message_results in enumerate(results)
+               if any(result is MISSING for result in message_results.values())]
+    if not missing:
+        return results
+
+    input_data = classifier.featurizer.transform_batch([messages[i].stems for i in missing])
+    for mode, probabilities in classifier.predict(input_data).items():
+        categories, best = best_predictions(probabilities, mode)
+        for row, i in enumerate(missing):
+            result = None
+            if categories[row] >= 0:
+                result = PredictionResult(
+                    mode.category_type(int(categories[row])), float(best[row]))
+            results[i][mode] = result
+            classification_memo.put(keys[i][mode], result)
+    return results
+
+
+def prediction_result(probabilities: np.ndarray, mode: Mode) -> Optional[PredictionResult]:
+    """
+    Picks the most probable category from the output of a model if it passes
+    the error threshold of the mode.
+
+    Args:
+        probabilities: The probability for every category of the mode.
+        mode: The mode the probabilities were predicted for.
+
+    Returns:
+        The most probable category or None if it is not probable enough.
+    """
+    lower_bound = 0 if mode == Mode.PATTERNS else -1
+
+    CategoryType = mode.category_type
+
+    results = [PredictionResult(CategoryType(i), p) for i, p in enumerate(probabilities)
+               if i > lower_bound]
+    results.sort(key=lambda result: result.probability, reverse=True)
+
+    # Log all results to debug the percentages
+    logger.debug('Results: %s', results)
 
     # Only the most-probable result is interesting for us here.
     # Check if it passes the error threshold and continue if applicable.
-    if len(results) > 0 and results[0].probability > error_threshold:
+    if len(results) > 0 and results[0].probability > error_threshold(mode):
         return results[0]
 
     return None
 
 
+def best_predictions(
+    probabilities: np.ndarray,
+    mode: Mode,
+    threshold: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized form of prediction_result for the output of a model on many
+    inputs at once.
+
+    Args:
+        probabilities: The probability for every category, one row per input.
+        mode: The mode the probabilities were predicted for.
+        threshold: The error threshold, the one of the mode by default.
+
+    Returns:
+        The index of the most probable category of every input, or -1 if it
+        did not pass the error threshold of the mode, and its probability.
+    """
+    # The BLACKLIST category is never recognized as a pattern
+    first = 1 if mode == Mode.PATTERNS else 0
+    candidates = probabilities[:, first:]
+    categories = candidates.argmax(axis=1) + first
+    best = candidates.max(axis=1)
+    if threshold is None:
+        threshold = error_threshold(mode)
+    categories[best <= threshold] = -1
+    return categories, best
+
+
 # Pattern transitions for context recognition as a relation of the form
 # { [PatternCategory, PatternCategory]: PatternCategory }.
 # Only the previously occuring pattern will be considered for transitions and
@@ -103,19 +240,24 @@ pattern_transitions: Dict[Tuple[PatternCategory, PatternCategory], PatternCatego
 }
 
 
-def answer_for_pattern(request: Request) -> Optional[Tuple[PatternCategory, str]]:
+def answer_for_pattern(
+    request: Request,
+    result: Optional[PredictionResult]
+) -> Optional[Tuple[PatternCategory, str]]:
     """
-    Scans the supplied request for pre-defined patterns and returns a
-    pre-defined answer if possible.
+    Returns a pre-defined answer for the pattern recognized in the supplied
+    request if possible.
 
     Args:
-        request: The request to scan for patterns.
+        request: The request the pattern was recognized in.
+        result:
+            The pattern recognized by analyze_input or classify, or None if
+            no pattern was recognized.
 
     Returns:
         A tuple containing the detected pattern category and pre-defined answer
         for the scanned request, or None if no pattern was recognized.
     """
-    result = analyze_input(request.text, Mode.PATTERNS)
     if result is not None:
         # Pattern found
         category = result.category
@@ -144,7 +286,8 @@ def demo():
         bot_birthdate=date(1995, 10, 5),
         bot_favorite_color='grün'
     )
-    answer = answer_for_pattern(request)
+    result = analyze_input(preprocess(request.text), Mode.PATTERNS)
+    answer = answer_for_pattern(request, result)
     if answer is None:
         print('No answer found')
     else:
@@ -0,0 +1,116 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Any, Dict, Optional
+
+from bot import metrics
+from bot.logger import logger
+from bot.request_handler import handle_message, setup_streams
+
+
+def handle_line(json_data: str) -> Dict[str, Any]:
+    """
+    Parses and handles a single request line of the pipelined protocol.
+
+    Args:
+        json_data:
+            The JSON encoded request, i.e. the usual request data plus an
+            "id" field that is copied to the response. Control messages can
+            be sent with an id as well.
+
+    Returns:
+        The response data tagged with the id of the request, or an error
+        tagged with the id if the request could not be handled.
+    """
+    request_id: Optional[Any] = None
+    try:
+        with metrics.timed('decode'):
+            data = json.loads(json_data)
+        request_id = data.get('id')
+        result = handle_message(data)
+    except Exception as ex:
+        metrics.count('errors')
+        logger.error('{}: {}'.format(type(ex).__name__, str(ex)))
+        result = {'error': '{}: {}'.format(type(ex).__name__, str(ex))}
+    result['id'] = request_id
+    return result
+
+
+async def serve(input_stream, output_stream, executor: ThreadPoolExecutor):
+    """
+    Reads request lines until EOF and handles them concurrently in the
+    executor. Every response is written as soon as it is finished, so
+    responses can be written in a different order than the requests arrived.
+
+    Args:
+        input_stream: The stream to read request lines from.
+        output_stream: The stream to write response lines to.
+        executor: The executor handling the requests.
+    """
+    loop = asyncio.get_event_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+
+    def read_lines():
+        # Reading blocks, so it is done in its own thread which hands the
+        # lines over to the event loop
+        while True:
+            json_data = input_stream.readline()
+            if json_data == '':
+                # Empty string equals EOF for io.TextIOWrapper
+                loop.call_soon_threadsafe(lines.put_nowait, None)
+                return
+            loop.call_soon_threadsafe(lines.put_nowait, json_data)
+
+    Thread(target=read_lines, name='request-reader', daemon=True).start()
+
+    async def respond(json_data: str):
+        result = await loop.run_in_executor(executor, handle_line, json_data)
+        # Only the event loop thread writes, so lines are never interleaved
+        output_stream.write(json.dumps(result) + '\n')
+
+    pending = set()
+    while True:
+        json_data = await lines.get()
+        if json_data is None:
+            logger.info('EOF detected, finishing pending requests')
+            break
+        if json_data.strip() == '':
+            continue
+        task = asyncio.ensure_future(respond(json_data))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.wait(pending)
+
+
+def run_pipelined_loop(workers: int):
+    """
+    Starts a request loop that keeps reading requests from stdin while
+    earlier requests are still being handled.
+
+    Every request line is a JSON object with the usual request data and an
+    additional "id" field. Requests are handled concurrently by a pool of
+    worker threads, so a request with a predefined answer does not have to
+    wait for a slower request that needs the text generator. Responses are
+    written to stdout as soon as they are finished, tagged with the id of
+    their request. If a request could not be handled, an object containing
+    the id and an "error" field is written instead.
+
+    The loop ends when stdin is closed, after all pending requests have been
+    answered.
+
+    Args:
+        workers: The maximum number of requests handled at the same time.
+    """
+    logger.info('Starting pipelined request loop with {} workers'.format(workers))
+
+    input_stream, output_stream = setup_streams()
+    loop = asyncio.get_event_loop()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            loop.run_until_complete(serve(input_stream, output_stream, executor))
+        except KeyboardInterrupt:
+            # Interrupt requested by developer
+            logger.info('Keyboard interrupt detected, aborting request loop')
@@ -1,27 +1,143 @@
 from os import path
 from pathlib import Path
-from typing import Dict, List
+from string import Formatter
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional
 
 from bot.data import Request
 from bot.model_definitions import PatternCategory
 
-# Cache for category answers
-cache: Dict[str, List[str]] = {}
-
 dir = path.dirname(__file__)
 
+# Attributes of the request that can be referenced by answer templates,
+# i.e. all fields and helper properties of the Request class
+request_attributes = set(Request._fields) | {
+    name for name, value in vars(Request).items() if isinstance(value, property)}
+
+
+class TemplatePiece(NamedTuple):
+    """
+    A literal text followed by an optional reference to a request attribute,
+    as parsed from an answer template.
+    """
+    literal: str
+    attribute: Optional[str]
+    conversion: Optional[str]
+    format_spec: str
+
+
+class AnswerTemplate:
+    """
+    A predefined answer that has been parsed into pieces when it was loaded,
+    so rendering it for a request does not parse the template again.
+    """
+
+    def __init__(self, template: str):
+        """
+        Parses an answer template. Templates reference attributes of the
+        request as {r.attribute}, optionally with a conversion and format
+        spec like str.format.
+
+        Args:
+            template: The answer template.
+
+        Raises:
+            ValueError:
+                Raised if the template is malformed or references something
+                that is not an attribute of the request.
+        """
+        self.template = template
+        pieces: List[TemplatePiece] = []
+        for literal, field, format_spec, conversion in Formatter().parse(template):
+            attribute = None
+            if field is not None:
+                prefix, _, attribute = field.partition('.')
+                if prefix != 'r' or attribute not in request_attributes:
+                    raise ValueError(
+                        'Unknown field {{{}}} in answer template: {}'.format(field, template))
+                if conversion not in (None, 's', 'r', 'a'):
+                    raise ValueError(
+                        'Unknown conversion !{} in answer template: {}'.format(
+                            conversion, template))
+            pieces.append(TemplatePiece(literal, attribute, conversion, format_spec or ''))
+        self.pieces = pieces
+
+    def render(self, request: Request) -> str:
+        """
+        Fills in the request attributes referenced by the template.
+
+        Args:
+            request: The request the answer is directed at.
+
+        Returns:
+            The formatted answer, equal to template.format(r=request).
+        """
+        parts = []
+        for literal, attribute, conversion, format_spec in self.pieces:
+            parts.append(literal)
+            if attribute is None:
+                continue
+            value = getattr(request, attribute)
+            if conversion == 's':
+                value = str(value)
+            elif conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            parts.append(format(value, format_spec))
+        return ''.join(parts)
+
+
+def load_answers() -> Dict[str, List[AnswerTemplate]]:
+    """
+    Reads and parses all answer definition files, including the _POS and _NEG
+    variants of a category.
+
+    Raises:
+        ValueError: Raised if any of the templates is invalid.
+
+    Returns:
+        The parsed answers by file name without extension.
+    """
+    answers: Dict[str, List[AnswerTemplate]] = {}
+    for p in sorted(Path(dir).glob('*.txt')):
+        with p.open(encoding='utf-8') as f:
+            answers[p.stem] = [AnswerTemplate(line) for line in f.read().splitlines()]
+    return answers
+
+
+# Store for all answers, loaded on first use
+answer_store: Optional[Dict[str, List[AnswerTemplate]]] = None
+answer_store_lock = Lock()
+
+
+def load_answer_store() -> Dict[str, List[AnswerTemplate]]:
+    """
+    Returns the answer store, loading all answer definition files on first
+    use.
+
+    Returns:
+        The parsed answers by file name without extension.
+    """
+    global answer_store
+    with answer_store_lock:
+        if answer_store is None:
+            answer_store = load_answers()
+        return answer_store
+
 
 def answers_for_category(
     category: PatternCategory,
     request: Request
-) -> List[str]:
+) -> List[AnswerTemplate]:
     """
     Returns all predefined answers for the given category if possible.
-    Answers are cached per category, so the first call for a category will read
-    all defined answers into memory which will be re-used by subsequent calls.
+    All answers are loaded into memory by the first call, which will be
+    re-used by subsequent calls.
 
     Args:
         category: The category to retrieve answers for.
+        request: The request, used for choosing between positive and negative answers.
 
     Raises:
         FileNotFoundError:
@@ -40,16 +156,8 @@ def answers_for_category(
         direction = '_POS' if request.affection > 0.5 else '_NEG'
 
     name = category.name + direction
-    if name in cache:
-        return cache[name]
-
-    p = Path(dir, name + '.txt')
-
-    if not p.is_file():
+    answers = load_answer_store().get(name)
+    if answers is None:
         raise FileNotFoundError(
             'No answer definition file found for category {}'.format(category))
-
-    with p.open(encoding='utf-8') as f:
-        answers = f.read().splitlines()
-        cache[category] = answers
-        return answers
+    return answers
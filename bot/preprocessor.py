@@ -0,0 +1,89 @@
+from typing import List, NamedTuple
+
+import nltk
+from nltk.stem.snowball import GermanStemmer
+
+# Create German snowball stemmer
+stemmer = GermanStemmer()
+
+# Whether the tokenizer model has been made available and loaded
+tokenizer_loaded = False
+
+
+class PreprocessedMessage(NamedTuple):
+    """
+    A message text split into the forms needed by the classifiers and the
+    text generator. Computed once per request and passed to every stage of the
+    request pipeline.
+    """
+    text: str
+    tokens: List[str]
+    casefolded: List[str]
+    stems: List[str]
+
+    @property
+    def generator_input(self) -> str:
+        """
+        The tokenized, casefolded text that is fed into the text generator.
+        """
+        return ' '.join(self.casefolded)
+
+
+def load_tokenizer():
+    """
+    Downloads the nltk model required for the tokenizer if it is missing and
+    loads it. The model is only looked up once per process.
+    """
+    global tokenizer_loaded
+    if tokenizer_loaded:
+        return
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt', quiet=True)
+    # Tokenizing once loads the German model into nltk's resource cache
+    nltk.word_tokenize('Hallo', language='german')
+    tokenizer_loaded = True
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into word and punctuation tokens.
+
+    Args:
+        text: The text to tokenize.
+
+    Returns:
+        The tokens of the text.
+    """
+    load_tokenizer()
+    return nltk.word_tokenize(text, language='german')
+
+
+def stem(tokens: List[str]) -> List[str]:
+    """
+    Reduces tokens to their stems using the German snowball stemmer.
+
+    Args:
+        tokens: The tokens to stem.
+
+    Returns:
+        The stem of every token.
+    """
+    return [stemmer.stem(token.casefold()) for token in tokens]
+
+
+def preprocess(text: str) -> PreprocessedMessage:
+    """
+    Tokenizes and stems a message text.
+
+    Args:
+        text: The message text to preprocess.
+
+    Returns:
+        The preprocessed message.
+    """
+    tokens = tokenize(text)
+    casefolded = [token.casefold() for token in tokens]
+    stems = [stemmer.stem(token) for token in casefolded]
+    return PreprocessedMessage(text, tokens, casefolded, stems)
@@ -0,0 +1,128 @@
+import os
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bot import classifier, model_loader
+from bot.classifier import FusedClassifier, load_fused_classifier
+from bot.logger import logger
+from bot.model_definitions import Mode
+from bot.model_loader import LoadedModel, artifact_signature, read_model
+from bot.pattern_recognizer import classification_memo
+
+# Only one reload runs at a time
+reload_lock = Lock()
+
+
+def changed_modes() -> List[Mode]:
+    """
+    Returns the modes whose artifact in the models directory differs from
+    the artifact the running model was loaded from.
+    """
+    current = load_fused_classifier().models
+    return [mode for mode in Mode
+            if artifact_signature(mode) not in (None, current[mode].signature)]
+
+
+def warm(fused: FusedClassifier):
+    """
+    Runs the classifier once, which reads every weight it uses and so faults
+    the pages of the fused first layer and of newly mapped artifacts into
+    memory before the first request.
+    """
+    fused.predict(np.zeros((1, fused.featurizer.size), dtype=np.float32))
+
+
+def reload_models() -> List[Mode]:
+    """
+    Loads the models whose artifacts have been replaced since they were
+    loaded, builds and warms a new fused classifier from them and swaps it
+    in. Requests keep using the previous models until the swap, which only
+    replaces references, so a request that is being handled finishes with
+    the models it started with.
+
+    Returns:
+        The modes that were reloaded.
+    """
+    with reload_lock:
+        modes = changed_modes()
+        if not modes:
+            return []
+
+        start = perf_counter()
+        models: Dict[Mode, LoadedModel] = dict(load_fused_classifier().models)
+        for mode in modes:
+            models[mode] = read_model(mode)
+        fused = FusedClassifier(models)
+        warm(fused)
+
+        # Swap in the new models, every following request uses them
+        model_loader.model_cache.update(models)
+        classifier.fused_cache = fused
+        # Results of the previous models can not be used any more
+        classification_memo.clear()
+
+        logger.info('Reloaded {} models in {:.3f}s'.format(
+            ', '.join(mode.value for mode in modes), perf_counter() - start))
+        return modes
+
+
+def reload_in_background() -> Thread:
+    """
+    Reloads replaced models in a background thread.
+
+    Returns:
+        The started thread.
+    """
+    def run():
+        try:
+            reload_models()
+        except Exception as ex:
+            # The previous models stay in use
+            logger.error('Model reload failed: {}: {}'.format(type(ex).__name__, str(ex)))
+
+    thread = Thread(target=run, name='model-reload', daemon=True)
+    thread.start()
+    return thread
+
+
+def watch_models(interval: float) -> Thread:
+    """
+    Checks the models directory for replaced artifacts in a background
+    thread and reloads them.
+
+    Args:
+        interval: The seconds between two checks.
+
+    Returns:
+        The started thread.
+    """
+    def run():
+        while True:
+            sleep(interval)
+            try:
+                if changed_modes():
+                    reload_models()
+            except Exception as ex:
+                logger.error('Model reload failed: {}: {}'.format(type(ex).__name__, str(ex)))
+
+    thread = Thread(target=run, name='model-watch', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_model_watch() -> Optional[Thread]:
+    """
+    Starts watching the models directory if a check interval in seconds is
+    configured by the EVE_MODEL_WATCH environment variable.
+
+    Returns:
+        The watching thread, or None if watching is disabled.
+    """
+    interval = float(os.environ.get('EVE_MODEL_WATCH', '0'))
+    if interval <= 0:
+        return None
+    logger.info('Watching models every {}s'.format(interval))
+    return watch_models(interval)
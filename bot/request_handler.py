@@ -1,49 +1,124 @@
 import io
+import os
 import sys
 import json
 from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
 
-from bot.data import Gender, Request, Response, parse_request
-from bot.logger import logger
+from bot import metrics, reloader
+from bot.data import Gender, Request, Response, request_from_dict
+from bot.logger import begin_request, logger
+from bot.memory import memory_report
+from bot.metrics import timed
+from bot.model_definitions import Mode
+from bot.model_loader import model_cache
 from bot.mood_analyzer import analyze
-from bot.pattern_recognizer import answer_for_pattern
-from bot.text_processor.generator import generate_answer
+from bot.pattern_recognizer import (
+    answer_for_pattern, classification_memo, classify, classify_batch)
+from bot.preprocessor import preprocess
+from bot.text_processor import generator
+from bot.text_processor.generator import generate_answer, generate_answers
 
 
-def handle_request(request: Request) -> Response:
+def handle_request(request: Request, use_generator: bool = True) -> Response:
     """
     Handles a request and generates an appropriate response.
 
     Args:
         request: The request to handle.
+        use_generator:
+            Whether the text generator answers the request if no pattern is
+            recognized. Otherwise the text of such a response is None.
 
     Returns:
         The response generated for the specified request.
     """
-    logger.debug('Handling request: {}'.format(request))
+    begin_request()
+    logger.debug('Handling request: %s', request)
 
     # mood, affection:
     # value between -1 (negative sentiment) and 1 (positive sentiment)
 
-    mood_bot, affection_bot = analyze(request)
-    logger.debug('Mood {}, Affection {}'.format(mood_bot, affection_bot))
-    result = answer_for_pattern(request)
+    # Tokenize and stem the text once for all following stages
+    with timed('preprocess'):
+        message = preprocess(request.text)
+
+    # Estimate pattern, mood and affection in a single pass
+    with timed('classify'):
+        results = classify(message)
+
+    with timed('analyze'):
+        mood_bot, affection_bot = analyze(
+            request, results[Mode.MOODS], results[Mode.AFFECTIONS])
+    logger.debug('Mood %s, Affection %s', mood_bot, affection_bot)
+    with timed('static answer'):
+        result = answer_for_pattern(request, results[Mode.PATTERNS])
     if result:
         pattern, answer = result
     else:
         # No pattern found, fall back to generative model
         pattern = None
-        answer = generate_answer(request)
+        answer = None
+        if use_generator:
+            with timed('generator'):
+                answer = generate_answer(request, message)
 
     response = Response(text=answer,
                         pattern=pattern,
                         mood=mood_bot,
                         affection=affection_bot)
-    logger.debug(response)
+    logger.debug('Response: %s', response)
 
     return response
 
 
+def handle_requests(requests: List[Request]) -> List[Response]:
+    """
+    Handles multiple requests at once, giving the same responses as
+    handle_request. The messages are classified together and all requests
+    without a recognized pattern are passed to the text generator together.
+
+    Args:
+        requests: The requests to handle.
+
+    Returns:
+        The responses in the order of the requests.
+    """
+    with timed('preprocess'):
+        messages = [preprocess(request.text) for request in requests]
+
+    with timed('classify'):
+        results = classify_batch(messages)
+
+    responses: List[Optional[Response]] = []
+    fallback: List[int] = []
+    for i, request in enumerate(requests):
+        begin_request()
+        logger.debug('Handling request: %s', request)
+        with timed('analyze'):
+            mood_bot, affection_bot = analyze(
+                request, results[i][Mode.MOODS], results[i][Mode.AFFECTIONS])
+        logger.debug('Mood %s, Affection %s', mood_bot, affection_bot)
+        with timed('static answer'):
+            result = answer_for_pattern(request, results[i][Mode.PATTERNS])
+        pattern, answer = result if result else (None, None)
+        if not result:
+            fallback.append(i)
+        responses.append(Response(text=answer,
+                                  pattern=pattern,
+                                  mood=mood_bot,
+                                  affection=affection_bot))
+
+    if fallback:
+        # No pattern found, fall back to generative model
+        with timed('generator'):
+            answers = generate_answers([messages[i] for i in fallback])
+        for i, answer in zip(fallback, answers):
+            responses[i] = responses[i]._replace(text=answer)
+
+    return responses
+
+
 def run_demo():
     """
     Starts a command-line based demo request loop for debugging.
@@ -79,6 +154,116 @@ def run_demo():
             continue
 
 
+def setup_streams() -> Tuple[io.TextIOWrapper, io.TextIOWrapper]:
+    """
+    Sets up the UTF-8 encoded, newline separated streams used by the request
+    loops for reading requests from stdin and writing responses to stdout.
+
+    Returns:
+        The input and the line buffered output stream.
+    """
+    input_stream = io.TextIOWrapper(
+        sys.stdin.buffer, encoding='utf-8', newline='\n')
+    output_stream = io.TextIOWrapper(
+        sys.stdout.buffer, encoding='utf-8', newline='\n', line_buffering=True)
+    return input_stream, output_stream
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Returns a snapshot of the metrics of this process: the latency of every
+    stage of the request handling, the request counters, the statistics of
+    the classification memo and the answer cache and the memory usage.
+    """
+    answer_cache = generator.resident_cache
+    memory = memory_report()
+    snapshot = metrics.snapshot()
+    snapshot.update({
+        'pid': os.getpid(),
+        'classification_memo': classification_memo.stats(),
+        'answer_cache': answer_cache.stats() if answer_cache is not None else None,
+        'memory': memory['total'] if memory is not None else None,
+        'models': {mode.value: loaded.version for mode, loaded in model_cache.items()},
+    })
+    return snapshot
+
+
+def handle_command(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Handles a control message, i.e. a line with a "cmd" field instead of
+    request data.
+
+    Supported commands are "stats", which returns a snapshot of the metrics
+    of this process, and "reload", which reloads the models whose artifacts
+    have been replaced. The reload runs in the background unless "wait" is
+    true, in which case the reloaded modes are returned once they are in use.
+
+    Args:
+        data: The decoded control message.
+
+    Raises:
+        ValueError: Raised if the command is unknown.
+
+    Returns:
+        The result of the command.
+    """
+    command = data['cmd']
+    if command == 'stats':
+        return stats()
+    if command == 'reload':
+        if data.get('wait'):
+            return {'reloaded': [mode.value for mode in reloader.reload_models()]}
+        reloader.reload_in_background()
+        return {'reloading': True}
+    raise ValueError('Unknown command {}'.format(command))
+
+
+def handle_message(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Handles a decoded line of the request loop protocol, which is either a
+    control message or a request.
+
+    Args:
+        data: The decoded line.
+
+    Returns:
+        The result of the control message or the response data.
+    """
+    if 'cmd' in data:
+        metrics.count('commands')
+        return handle_command(data)
+    metrics.count('requests')
+    with timed('request'):
+        with timed('parse'):
+            request = request_from_dict(data)
+        return handle_request(request)._asdict()
+
+
+def respond(json_data: str) -> str:
+    """
+    Parses and handles a single line of the line-in/line-out protocol.
+
+    Args:
+        json_data: The JSON encoded request or control message.
+
+    Returns:
+        The JSON encoded response or command result, or the 'error' string if
+        an error was raised during parsing of the line or its handling.
+    """
+    try:
+        logger.debug('Received request, parsing')
+        with timed('decode'):
+            data = json.loads(json_data)
+        result = handle_message(data)
+        with timed('encode'):
+            return json.dumps(result)
+    except Exception as ex:
+        metrics.count('errors')
+        logger.error('{}: {}'.format(type(ex).__name__, str(ex)))
+        # Pass error to Go and await next request
+        return 'error'
+
+
 def run_loop():
     """
     Starts a request loop that reads lines from stdin.
@@ -92,6 +277,10 @@ def run_loop():
     the 'error\n' string written to stdout. The loop will then wait for a new
     request.
 
+    Lines with a "cmd" field are control messages instead of requests, e.g.
+    {"cmd": "stats"} is answered with a JSON snapshot of the metrics of the
+    bot process.
+
     The loop can be interrupted by either closing the stdin pipe, resulting in
     an EOFError handled by the loop, or by sending a
     keyboard interrupt (Ctrl + C).
@@ -99,10 +288,7 @@ def run_loop():
     logger.info('Starting request loop')
 
     # Setup streams for reading requests and writing responses
-    input_stream = io.TextIOWrapper(
-        sys.stdin.buffer, encoding='utf-8', newline='\n')
-    output_stream = io.TextIOWrapper(
-        sys.stdout.buffer, encoding='utf-8', newline='\n', line_buffering=True)
+    input_stream, output_stream = setup_streams()
 
     while True:
         try:
@@ -114,16 +300,8 @@ def run_loop():
                 logger.info('EOF detected, aborting request loop')
                 return
 
-            logger.debug('Received request, parsing')
-            request = parse_request(json_data)
-            response = handle_request(request)
-            output_stream.write(json.dumps(response._asdict()) + '\n')
+            output_stream.write(respond(json_data) + '\n')
         except KeyboardInterrupt:
             # Interrupt requested by developer
             logger.info('Keyboard interrupt detected, aborting request loop')
             return
-        except Exception as ex:
-            logger.error('{}: {}'.format(type(ex).__name__, str(ex)))
-            # Pass error to Go and await next request
-            print('error')
-            continue
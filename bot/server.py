@@ -0,0 +1,148 @@
+import os
+import random
+import signal
+import socket
+from time import sleep
+from typing import Set
+
+from bot.logger import logger, restart_logging, stop_logging
+from bot.request_handler import respond
+
+# Seconds to wait before replacing a worker that exited unexpectedly
+RESPAWN_DELAY = 1.0
+
+
+def serve_connection(conn: socket.socket):
+    """
+    Handles requests sent over a single client connection until the client
+    closes it. Uses the same line-in/line-out protocol as the stdin loop.
+
+    Args:
+        conn: The accepted client connection.
+    """
+    with conn.makefile('r', encoding='utf-8', newline='\n') as reader, \
+            conn.makefile('w', encoding='utf-8', newline='\n') as writer:
+        for json_data in reader:
+            writer.write(respond(json_data) + '\n')
+            writer.flush()
+
+
+def run_worker(listener: socket.socket):
+    """
+    Accepts and serves connections in a forked worker process.
+    The worker inherits the models loaded by the master. The text generator
+    is loaded by every worker itself, as TensorFlow sessions do not survive
+    a fork.
+
+    Args:
+        listener: The listening socket shared by all workers.
+    """
+    from bot.reloader import start_model_watch
+    from bot.startup import warm_up_generator_in_background
+
+    # Restore default signal handling and make sure every worker picks
+    # different predefined answers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    random.seed()
+
+    warm_up_generator_in_background()
+    # Every worker swaps in new models itself, as they are not shared after the fork
+    start_model_watch()
+    logger.info('Worker {} accepting connections'.format(os.getpid()))
+    while True:
+        conn, _ = listener.accept()
+        try:
+            serve_connection(conn)
+        except OSError as ex:
+            logger.error('Connection failed: {}'.format(ex))
+        finally:
+            conn.close()
+
+
+def spawn_worker(listener: socket.socket) -> int:
+    """
+    Forks a new worker process.
+
+    Args:
+        listener: The listening socket shared by all workers.
+
+    Returns:
+        The process id of the worker.
+    """
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        restart_logging()
+        try:
+            run_worker(listener)
+        except BaseException as ex:
+            logger.error('Worker {} failed: {}: {}'.format(
+                os.getpid(), type(ex).__name__, str(ex)))
+            exit_code = 1
+        finally:
+            # os._exit skips the atexit handlers, so queued records are written here
+            stop_logging()
+            os._exit(exit_code)
+    return pid
+
+
+def run_server(socket_path: str, workers: int):
+    """
+    Starts a pre-fork server that answers requests on a Unix socket.
+
+    The master process loads and warms up the classifiers once and then forks
+    the workers, which share the loaded models with the master copy-on-write
+    instead of loading them again. Clients connect to the socket and send
+    JSON encoded requests separated by newlines, every request is answered
+    by a JSON encoded response or the 'error' string on its own line.
+    Workers that exit unexpectedly are replaced. The server shuts down all
+    workers on SIGTERM or SIGINT.
+
+    Args:
+        socket_path: The path of the Unix socket to listen on.
+        workers: The number of worker processes.
+    """
+    from bot.startup import warm_up
+
+    # Only fork-safe subsystems are loaded before forking
+    warm_up(generator=False)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    logger.info('Listening on {} with {} workers'.format(socket_path, workers))
+
+    children: Set[int] = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        for _ in range(workers):
+            children.add(spawn_worker(listener))
+        while children:
+            pid, status = os.wait()
+            children.discard(pid)
+            if stopping:
+                continue
+            logger.warning('Worker {} exited with status {}, replacing it'.format(pid, status))
+            sleep(RESPAWN_DELAY)
+            children.add(spawn_worker(listener))
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        logger.info('Server stopped')
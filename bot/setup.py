@@ -1,15 +1,12 @@
 from typing import List, Tuple, Type, Set
 
-import nltk
 import numpy as np
 from keras import Sequential
 from keras.layers import Dense, Dropout
-from nltk.stem.snowball import GermanStemmer
 
-from bot.affections import patterns_for_affection
+from bot.featurizer import Featurizer
 from bot.model_definitions import Category, Mode
-from bot.moods import patterns_for_mood
-from bot.patterns import patterns_for_category
+from bot.training_corpus import preprocess_corpus
 
 
 def setup_bot(mode: Mode) -> Tuple[
@@ -38,7 +35,9 @@ def setup_bot(mode: Mode) -> Tuple[
 
 def read_training_data(mode: Mode) -> Tuple[List[Tuple[Category, Set[str]]], List[str]]:
     """
-    Reads the training data for the specified mode.
+    Reads the training data for the specified mode. The pattern definition
+    files are tokenized and stemmed by bot.training_corpus, which only
+    preprocesses files that changed since the last run.
 
     Args:
         mode: The mode to load training data for.
@@ -48,69 +47,21 @@ def read_training_data(mode: Mode) -> Tuple[List[Tuple[Category, Set[str]]], Lis
         and the bag of words used for indexing a string (i.e. for conversion to a
         1xN matrix as feature parameters).
     """
+    corpus = preprocess_corpus(mode)
 
+    elements: List[Tuple[Category, Set[str]]] = [
+        (category, set(stems))
+        for category in mode.category_type
+        for stems in corpus[category.name].stems
+    ]
     total_stems: Set[str] = set()
-    elements: List[Tuple[Category, Set[str]]] = []
-
-    if mode == Mode.PATTERNS:
-        reader_func = patterns_for_category
-    elif mode == Mode.AFFECTIONS:
-        reader_func = patterns_for_affection
-    elif mode == Mode.MOODS:
-        reader_func = patterns_for_mood
-    else:
-        raise ValueError('Unknown mode {}'.format(mode))
-
-    CategoryType = mode.category_type
-
-    # Iterate over all defined categories
-    for category in CategoryType:
-        # Parse all patterns defined for this category
-        patterns = reader_func(category)
-        for pattern in patterns:
-            total_stems = build_stems(pattern, category, elements, total_stems)
+    for _, stems in elements:
+        total_stems |= stems
 
-    words = sorted(list(total_stems))
+    words = sorted(total_stems)
     return elements, words
 
 
-def build_stems(
-    pattern: str,
-    category: Category,
-    elements: List[Tuple[Category, Set[str]]],
-    total_stems: Set[str]
-) -> Set[str]:
-    """
-    Builds a set of stems for all words used in the pattern.
-
-    Args:
-        pattern: The pattern to tokenize and stem.
-        category: The category of the pattern.
-        elements:
-            A mutable list of (category, stem) pairs that the new stems will
-            be appended to.
-        total_stems:
-            The set of total stems before this function was invoked.
-            Will not be mutated.
-
-    Returns:
-        The union of total_stems and stems found in the pattern.
-    """
-
-    # Tokenize pattern into words
-    words = nltk.word_tokenize(pattern)
-    # Get stems for the pattern's words, as a set to avoid duplicates
-    stemmer = GermanStemmer()
-    stems: Set[str] = {stemmer.stem(w.lower()) for w in words}
-    # Add stems associated with association to the category to the
-    # pattern list.
-    elements.append((category, stems))
-    # Add stems to total set of stems, needed for conversion to numeric
-    # TensorFlow training array
-    total_stems |= stems
-    return total_stems
-
-
 def setup_traing_data(
     CategoryType: Type[Category],
     elements: List[Tuple[Category, Set[str]]],
@@ -133,21 +84,40 @@ def setup_traing_data(
         The training axes x and y, where x is the feature axis and y is the
         label (= category) axis.
     """
-    train_x = []
-    train_y = []
-    for category, stems in elements:
-        bag_of_words = [1 if word in stems else 0 for word in words]
-        output_row = [0] * len(CategoryType)
-        output_row[category] = 1
-        train_x.append(bag_of_words)
-        train_y.append(output_row)
-    # Convert lists to numpy arrays
-    train_x = np.asarray(train_x)
-    train_y = np.asarray(train_y)
+    featurizer = Featurizer(words)
+    train_x = featurizer.transform_batch([stems for _, stems in elements])
+    # One-hot encode the categories
+    categories = [category for category, _ in elements]
+    train_y = np.zeros((len(elements), len(CategoryType)), dtype=np.float32)
+    train_y[np.arange(len(elements)), categories] = 1
     return train_x, train_y
 
 
-def setup_nn_model(train_x: np.ndarray, train_y: np.ndarray) -> Sequential:
+# The amount of neurons to work with
+# https://stackoverflow.com/a/44748370
+# Most bag-of-words training examples use 512 here
+UNITS = 512
+
+# Probability that a neuron will be ignored while processing input
+# http://papers.nips.cc/paper/4878-understanding-dropout.pdf suggests that
+# 50% gives the best results
+DROPOUT_RATE = 0.5
+
+# Supported network architectures:
+# dense: a hidden ReLU layer with dropout, followed by the softmax output
+# bag: a hidden linear layer, i.e. the sum of one learned vector per stem
+#      like an embedding bag, followed by the softmax output
+# linear: only the softmax output layer
+VARIANTS = ['dense', 'bag', 'linear']
+
+
+def setup_nn_model(
+    train_x: np.ndarray,
+    train_y: np.ndarray,
+    units: int = UNITS,
+    dropout_rate: float = DROPOUT_RATE,
+    variant: str = 'dense'
+) -> Sequential:
     """
     Creates a sequential neural network model that takes a 1-dimensional array
     as input and outputs a number representing a category.
@@ -155,6 +125,12 @@ def setup_nn_model(train_x: np.ndarray, train_y: np.ndarray) -> Sequential:
     Args:
         train_x: The feature axis for the model.
         train_y: The label axis for the model.
+        units: The size of the hidden layer.
+        dropout_rate: The dropout rate after the hidden layer of the dense variant.
+        variant: The architecture of the network, one of VARIANTS.
+
+    Raises:
+        ValueError: Raised if the variant is unknown.
 
     Returns:
         An untrained sequential model.
@@ -167,21 +143,21 @@ def setup_nn_model(train_x: np.ndarray, train_y: np.ndarray) -> Sequential:
     # Amount of defined classes
     num_classes: int = len(train_y[0])
 
-    # The amount of neurons to work with
-    # https://stackoverflow.com/a/44748370
-    # Most bag-of-words training examples use 512 here
-    units: int = 512
-
-    # Probability that a neuron will be ignored while processing input
-    # http://papers.nips.cc/paper/4878-understanding-dropout.pdf suggests that
-    # 50% gives the best results
-    dropout_rate: float = 0.5
-
     model = Sequential()
 
-    model.add(
-        Dense(units, input_shape=(num_words,), activation='relu'))
-    model.add(Dropout(dropout_rate))
-    model.add(Dense(num_classes, activation='softmax'))
+    if variant == 'dense':
+        model.add(
+            Dense(units, input_shape=(num_words,), activation='relu'))
+        model.add(Dropout(dropout_rate))
+        model.add(Dense(num_classes, activation='softmax'))
+    elif variant == 'bag':
+        model.add(
+            Dense(units, input_shape=(num_words,), activation='linear'))
+        model.add(Dense(num_classes, activation='softmax'))
+    elif variant == 'linear':
+        model.add(
+            Dense(num_classes, input_shape=(num_words,), activation='softmax'))
+    else:
+        raise ValueError('Unknown network variant {}'.format(variant))
 
     return model
@@ -0,0 +1,134 @@
+import json
+import sys
+from importlib import import_module
+from threading import Thread
+from time import perf_counter
+from typing import Callable, List, NamedTuple, Tuple
+
+from bot.logger import logger
+
+
+class PhaseTiming(NamedTuple):
+    """
+    The duration of a single startup phase.
+    """
+    name: str
+    seconds: float
+    # Amount of modules imported during the phase
+    modules: int
+
+
+def run_phase(name: str, func: Callable[[], object]) -> PhaseTiming:
+    """
+    Runs and measures a single startup phase.
+
+    Args:
+        name: The name of the phase used in logs and reports.
+        func: The function executing the phase.
+
+    Returns:
+        The timing of the phase.
+    """
+    modules_before = len(sys.modules)
+    start = perf_counter()
+    func()
+    timing = PhaseTiming(name, perf_counter() - start, len(sys.modules) - modules_before)
+    logger.info('Startup phase {} took {:.3f}s'.format(name, timing.seconds))
+    return timing
+
+
+def classifier_phases() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    Returns the phases needed for answering requests with the classifiers
+    and predefined answers.
+    """
+    from bot.model_definitions import Mode
+
+    def load_model(mode):
+        return lambda: import_module('bot.model_loader').load_model(mode)
+
+    return [
+        ('import numpy', lambda: import_module('numpy')),
+        ('import nltk', lambda: import_module('nltk')),
+        ('import request handler', lambda: import_module('bot.request_handler')),
+        ('load tokenizer', lambda: import_module('bot.preprocessor').load_tokenizer()),
+        ('load predefined answers',
+         lambda: import_module('bot.predefined_answers').load_answer_store()),
+    ] + [
+        ('load {} model'.format(mode.value), load_model(mode)) for mode in Mode
+    ] + [
+        ('build fused classifier',
+         lambda: import_module('bot.classifier').load_fused_classifier()),
+    ]
+
+
+def generator_phases() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    Returns the phases needed for generating answers with the text generator.
+    """
+    return [
+        ('import tensorflow', lambda: import_module('tensorflow')),
+        ('import opennmt', lambda: import_module('opennmt')),
+        ('load generator model',
+         lambda: import_module('bot.text_processor.setup').load_model()),
+        ('build generator engine',
+         lambda: import_module('bot.text_processor.generator').load_engine()),
+    ]
+
+
+def warm_up(generator: bool = True) -> List[PhaseTiming]:
+    """
+    Loads all subsystems needed for handling requests in an explicit and
+    measured warm-up phase.
+
+    Args:
+        generator: Whether the text generator should be loaded as well.
+
+    Returns:
+        The timings of all executed phases.
+    """
+    phases = classifier_phases()
+    if generator:
+        phases += generator_phases()
+    return [run_phase(name, func) for name, func in phases]
+
+
+def warm_up_generator_in_background() -> Thread:
+    """
+    Loads the text generator in a background thread, so that requests that
+    can be answered by the classifiers do not have to wait for it.
+    Requests that need the generator earlier wait until it has been loaded.
+
+    Returns:
+        The started thread.
+    """
+    def run():
+        try:
+            for name, func in generator_phases():
+                run_phase(name, func)
+        except Exception as ex:
+            # The generator will be loaded again on first use
+            logger.error('Generator warm-up failed: {}: {}'.format(type(ex).__name__, str(ex)))
+
+    thread = Thread(target=run, name='generator-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def profile_startup():
+    """
+    Runs all startup phases in the foreground and prints the time spent in
+    each of them as a table, followed by the JSON encoded timings.
+    """
+    start = perf_counter()
+    timings = warm_up(generator=True)
+    total = perf_counter() - start
+
+    print('{:<28} {:>10} {:>8}'.format('phase', 'seconds', 'modules'))
+    for timing in timings:
+        print('{:<28} {:>10.3f} {:>8}'.format(timing.name, timing.seconds, timing.modules))
+    print('{:<28} {:>10.3f} {:>8}'.format('total', total, len(sys.modules)))
+    print(json.dumps({
+        'phases': [timing._asdict() for timing in timings],
+        'total_seconds': total,
+    }))
@@ -7,8 +7,8 @@ from bot.predefined_answers import answers_for_category
 
 def get_static_answer(category: PatternCategory, request: Request) -> str:
     """
-    Retrieves and formats a random predefined answer for the specified category
-    from the database.
+    Retrieves and renders a random predefined answer for the specified category
+    from the answer store.
 
     Args:
         category: The category to retrieve an answer for.
@@ -21,4 +21,4 @@ def get_static_answer(category: PatternCategory, request: Request) -> str:
     answers = answers_for_category(category, request)
     answer = random.choice(answers)
 
-    return answer.format(r=request)
+    return answer.render(request)
@@ -0,0 +1,193 @@
+import os
+import re
+import sqlite3
+from os import path
+from threading import Lock
+from time import time
+from typing import Dict, Optional
+
+# Amount of stored answers after which old entries are evicted again
+EVICTION_INTERVAL = 100
+# Version of the database schema, older databases are recreated
+SCHEMA_VERSION = 2
+
+
+def checkpoint_version(model_dir: str) -> str:
+    """
+    Identifies the latest checkpoint in the model directory without loading
+    TensorFlow, by reading the checkpoint state file written by TensorFlow.
+
+    Args:
+        model_dir: The directory containing the checkpoints.
+
+    Returns:
+        The path of the latest checkpoint and the modification time of its
+        index, or an empty string if no checkpoint exists.
+    """
+    state_path = path.join(model_dir, 'checkpoint')
+    if not path.isfile(state_path):
+        return ''
+    with open(state_path, encoding='utf-8') as f:
+        match = re.search(r'^model_checkpoint_path: "(.*)"$', f.read(), re.MULTILINE)
+    if match is None:
+        return ''
+    checkpoint = match.group(1)
+    if not path.isabs(checkpoint):
+        checkpoint = path.join(model_dir, checkpoint)
+    index_path = checkpoint + '.index'
+    mtime = path.getmtime(index_path) if path.isfile(index_path) else 0
+    return '{}@{}'.format(path.basename(checkpoint), mtime)
+
+
+class AnswerCache:
+    """
+    Persistent cache for generated answers, keyed by the generator input.
+
+    The answers are stored in an SQLite database that is shared by all bot
+    processes on the host and survives restarts. Every entry is tagged with
+    the checkpoint that generated it, so processes on different checkpoints
+    never return or overwrite each other's entries. Entries of other
+    checkpoints are removed when a process opens the cache or switches to a
+    new checkpoint.
+    Entries older than max_age seconds are evicted, and the least recently
+    used entries are evicted once the cache holds more than max_entries.
+    """
+
+    def __init__(self, db_path: str, version: str, max_entries: int, max_age: float):
+        """
+        Args:
+            db_path: The path of the SQLite database file.
+            version: The version of the checkpoint generating the answers.
+            max_entries: The maximum number of stored answers.
+            max_age: The maximum age of stored answers in seconds.
+        """
+        self.db_path = db_path
+        self.version = version
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = Lock()
+        self._pid: Optional[int] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not be shared with forked processes
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+
+        directory = path.dirname(self.db_path)
+        if directory and not path.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(
+            self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        # WAL allows readers in other processes while one process writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                connection.execute('DROP TABLE IF EXISTS answers')
+                connection.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS answers ('
+                'key TEXT NOT NULL, version TEXT NOT NULL, answer TEXT NOT NULL, '
+                'created REAL NOT NULL, used REAL NOT NULL, PRIMARY KEY (key, version))')
+            connection.execute('CREATE INDEX IF NOT EXISTS answers_used ON answers (used)')
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        # Answers of other checkpoints will never be returned again
+        connection.execute('DELETE FROM answers WHERE version != ?', (self.version,))
+        self._connection = connection
+        self._pid = os.getpid()
+        return connection
+
+    def set_version(self, version: str):
+        """
+        Switches to the answers of another checkpoint, e.g. after a new
+        checkpoint has been trained. Entries of other checkpoints are removed.
+
+        Args:
+            version: The version of the checkpoint generating the answers.
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.execute('DELETE FROM answers WHERE version != ?', (version,))
+
+    def clear(self):
+        """
+        Removes all stored answers of all checkpoints.
+        """
+        with self._lock:
+            self._connect().execute('DELETE FROM answers')
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up the answer for a generator input.
+
+        Args:
+            key: The generator input.
+
+        Returns:
+            The cached answer, or None if there is no valid entry.
+        """
+        now = time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                'SELECT answer FROM answers WHERE key = ? AND version = ? AND created >= ?',
+                (key, self.version, now - self.max_age)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            connection.execute('UPDATE answers SET used = ? WHERE key = ? AND version = ?',
+                               (now, key, self.version))
+            return row[0]
+
+    def put(self, key: str, answer: str):
+        """
+        Stores the answer for a generator input.
+
+        Args:
+            key: The generator input.
+            answer: The generated answer.
+        """
+        now = time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO answers (key, answer, version, created, used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, answer, self.version, now, now))
+            self._puts += 1
+            if self._puts % EVICTION_INTERVAL == 0:
+                self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        connection.execute('DELETE FROM answers WHERE created < ?', (now - self.max_age,))
+        connection.execute(
+            'DELETE FROM answers WHERE rowid IN ('
+            'SELECT rowid FROM answers ORDER BY used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,))
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit and miss counters of this process and the number of
+        entries currently stored by all processes.
+        """
+        with self._lock:
+            entries = self._connect().execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+        }
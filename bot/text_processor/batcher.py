@@ -0,0 +1,118 @@
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Thread
+from time import monotonic
+from typing import Callable, List, Optional, Tuple
+
+
+class GenerationBatcher:
+    """
+    Collects generator inputs of concurrent callers into micro-batches.
+
+    A background thread waits for the first input, then keeps collecting
+    inputs that arrive within the batch window, up to the maximum batch size.
+    All collected inputs are decoded in one call of the generate function and
+    every caller receives the answer for its own input.
+    """
+
+    def __init__(
+        self,
+        generate_fn: Callable[[List[str]], List[str]],
+        max_batch_size: int,
+        batch_window: float
+    ):
+        """
+        Starts the background thread of the batcher.
+
+        Args:
+            generate_fn:
+                Generates the answers for a list of inputs, in the same order.
+            max_batch_size: The maximum number of inputs decoded at once.
+            batch_window:
+                The time in seconds to wait for further inputs after the
+                first input of a batch has arrived.
+        """
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = max(0.0, batch_window)
+        self._queue: Queue = Queue()
+        self._thread = Thread(target=self._run, name='generation-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queues an input for the next batch.
+
+        Args:
+            text: The tokenized input text.
+
+        Returns:
+            A future that resolves to the generated answer.
+        """
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def generate(self, text: str) -> str:
+        """
+        Queues an input and blocks until its answer has been generated.
+
+        Args:
+            text: The tokenized input text.
+
+        Returns:
+            The generated answer.
+        """
+        return self.submit(text).result()
+
+    def close(self):
+        """
+        Stops the background thread after all queued inputs have been handled.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self) -> Optional[List[Tuple[str, Future]]]:
+        """
+        Blocks until a batch of inputs has been collected.
+
+        Returns:
+            The collected inputs with their futures, or None if the batcher
+            has been closed.
+        """
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # Window has passed, only take inputs that are already queued
+                    item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is None:
+                # Handle the current batch first, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            texts = [text for text, _ in batch]
+            try:
+                answers = self.generate_fn(texts)
+            except Exception as ex:
+                for _, future in batch:
+                    future.set_exception(ex)
+                continue
+            for (_, future), answer in zip(batch, answers):
+                future.set_result(answer)
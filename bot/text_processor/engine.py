@@ -0,0 +1,151 @@
+from io import StringIO
+from threading import Lock
+from typing import List
+
+import tensorflow as tf
+from opennmt.utils import data
+from opennmt.utils.misc import item_or_tuple
+
+
+def input_fn_impl(texts, model, batch_size, metadata):
+    """
+    Initializes the model with the metadata, creates a dataset from the input
+    texts and creates a process function that convert the inputs into
+    sequences. Then creates an initializable iterator that yields batches of
+    at most batch_size processed inputs.
+
+    Args:
+        texts: A 1-dimensional string tensor containing the input texts,
+            usually a placeholder that is fed for every prediction.
+        model: The trained model
+        batch_size: The maximum number of inputs to generate predictions for in one iteration call.
+        metadata: The config dict containg the paths to the vocabulary files.
+
+    Returns:
+        The iterator over the batched inputs. It has to be initialized with
+        the input texts before fetching the next element.
+    """
+    model._initialize(metadata)
+
+    dataset = tf.data.Dataset.from_tensor_slices(texts)
+    # Parallel inputs must be catched in a single tuple and not considered as multiple arguments.
+    process_fn = lambda *arg: model.source_inputter.process(item_or_tuple(arg))
+
+    dataset = dataset.map(
+        process_fn,
+        num_parallel_calls=1)
+    dataset = dataset.apply(data.batch_parallel_dataset(batch_size))
+
+    return dataset.make_initializable_iterator()
+
+
+class GeneratorEngine:
+    """
+    Long-lived inference engine for the OpenNMT sequence to sequence model.
+
+    The graph is built, the vocabulary tables are initialized and the weights
+    are restored from the latest checkpoint only once, when the engine is
+    created. Predictions are then served through a persistent session by
+    feeding the input texts into a placeholder, which avoids rebuilding an
+    estimator for every single request.
+    """
+
+    def __init__(self, model, config: dict):
+        """
+        Builds the inference graph and restores the trained weights.
+
+        Args:
+            model: The OpenNMT model definition.
+            config: The OpenNMT config dict, see bot.text_processor.setup.
+
+        Raises:
+            FileNotFoundError:
+                Raised if no checkpoint exists in the configured model directory.
+        """
+        checkpoint = tf.train.latest_checkpoint(config['model_dir'])
+        if checkpoint is None:
+            raise FileNotFoundError(
+                'No checkpoint found in {}'.format(config['model_dir']))
+
+        self.model = model
+        self.checkpoint = checkpoint
+        self.batch_size = config['infer'].get('batch_size', 1)
+        self._lock = Lock()
+
+        session_config = tf.ConfigProto(
+            allow_soft_placement=True,
+            log_device_placement=False
+        )
+        run_config = tf.estimator.RunConfig(
+            model_dir=config['model_dir'],
+            session_config=session_config)
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self._texts = tf.placeholder(tf.string, shape=(None,))
+            self._iterator = input_fn_impl(
+                self._texts,
+                model,
+                self.batch_size,
+                config['data']
+            )
+            model_fn = model.model_fn(num_devices=1)
+            spec = model_fn(
+                self._iterator.get_next(),
+                None,
+                config['params'],
+                tf.estimator.ModeKeys.PREDICT,
+                run_config
+            )
+            self._predictions = spec.predictions
+
+            saver = tf.train.Saver()
+            self.session = tf.Session(graph=self.graph, config=session_config)
+            self.session.run([
+                tf.global_variables_initializer(),
+                tf.local_variables_initializer(),
+                tf.tables_initializer()
+            ])
+            saver.restore(self.session, checkpoint)
+            self.graph.finalize()
+
+    def generate(self, texts: List[str]) -> List[str]:
+        """
+        Generates the raw model output for each of the given input texts.
+
+        Args:
+            texts: The tokenized input texts.
+
+        Returns:
+            The generated texts in the same order as the inputs, not yet
+            cleaned up for user output.
+        """
+        if not texts:
+            return []
+
+        outputs = []
+        # The iterator is shared by all callers, so feeding and draining it
+        # must not be interleaved between threads.
+        with self._lock:
+            self.session.run(self._iterator.initializer,
+                             feed_dict={self._texts: texts})
+            while True:
+                try:
+                    batch = self.session.run(self._predictions)
+                except tf.errors.OutOfRangeError:
+                    break
+                # Split the batched predictions into one prediction per input
+                size = len(next(iter(batch.values())))
+                for i in range(size):
+                    prediction = {key: value[i] for key, value in batch.items()}
+                    stream = StringIO()
+                    self.model.print_prediction(prediction, stream=stream)
+                    outputs.append(stream.getvalue())
+                    stream.close()
+        return outputs
+
+    def close(self):
+        """
+        Closes the tensorflow session of the engine.
+        """
+        self.session.close()
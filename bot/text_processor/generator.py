@@ -1,15 +1,23 @@
-from os import path
-from io import StringIO
 import os
+from threading import Lock, Thread
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-from opennmt.utils import data
-from opennmt.utils.misc import item_or_tuple
+from bot.data import Request
+from bot.logger import logger
+from bot.preprocessor import PreprocessedMessage
+from bot.text_processor.answer_cache import AnswerCache, checkpoint_version
+from bot.text_processor.batcher import GenerationBatcher
+from bot.text_processor.setup import config, load_model
 
-import tensorflow as tf
-import nltk
+if TYPE_CHECKING:
+    from bot.text_processor.engine import GeneratorEngine
 
-from bot.data import Request
-from bot.text_processor.setup import config, model
+# Answer used if no answer could be generated
+DEFAULT_ANSWER = 'Da fällt mir jetzt leider nichts zu ein.'
+
+# Seconds between two checks of the model directory for a new checkpoint
+CHECKPOINT_CHECK_INTERVAL = 10.0
 
 # Punctuation that appears before a word
 punct_before = ['(', '<', '„', ':']
@@ -46,106 +54,243 @@ def clean_output(text):
     return text.strip()
 
 
-def input_fn_impl(text, model, batch_size, metadata):
+# The engine and batcher are created on first use and then kept, the engine until a new
+# checkpoint has been loaded. The engine is not imported before that, as it imports TensorFlow.
+resident_engine: Optional['GeneratorEngine'] = None
+resident_batcher: Optional[GenerationBatcher] = None
+resident_cache: Optional[AnswerCache] = None
+# Version of the checkpoint the resident engine was restored from
+engine_version: Optional[str] = None
+# Number of running generate calls of every engine
+engine_users: Dict['GeneratorEngine', int] = {}
+# Thread loading a new checkpoint and the last version that failed to load
+reload_thread: Optional[Thread] = None
+failed_version: Optional[str] = None
+engine_lock = Lock()
+cache_lock = Lock()
+
+# Latest checkpoint version found in the model directory and when it was read
+latest_version: Optional[str] = None
+latest_version_time = 0.0
+version_lock = Lock()
+
+
+def current_version() -> str:
     """
-    Initializes the model with the metadata, creates a single-tensor dataset
-    from the input text and creates a process function that convert the input into
-    a sequence. Then creates an iterator that creates predictions for all input tensors.
-    Will only contain one in this case because there's only one string tensor as input,
-    but can also be used for generating predictions for a whole set of inputs, i.e.
-    a file listing multiple inputs to generate predictions for.
+    Returns the version of the latest checkpoint in the model directory. The
+    checkpoint state file is read again at most every
+    CHECKPOINT_CHECK_INTERVAL seconds.
+    """
+    global latest_version, latest_version_time
+    now = monotonic()
+    with version_lock:
+        if latest_version is None or now - latest_version_time >= CHECKPOINT_CHECK_INTERVAL:
+            latest_version = checkpoint_version(config['model_dir'])
+            latest_version_time = now
+        return latest_version
 
-    Args:
-        text: The input text
-        model: The trained model
-        batch_size: The maximum number of inputs to generate predictions for in one iteration call.
-        metadata: The config dict containg the paths to the vocabulary files.
+
+def load_engine() -> 'GeneratorEngine':
+    """
+    Returns the generator engine of this process, creating it on first use.
+    Creating the engine imports TensorFlow, builds the graph and restores the
+    checkpoint. Concurrent callers wait until the first engine has been
+    created. When a new checkpoint has been trained, a new engine is created
+    from it in the background and the current engine is used until then.
 
     Returns:
-        The first prediction in the iterator, i.e. the answer sequence to the
-        input text.
+        The resident generator engine.
     """
-    model._initialize(metadata)
+    global resident_engine, engine_version, reload_thread
+    version = current_version()
+    with engine_lock:
+        if resident_engine is None:
+            from bot.text_processor.engine import GeneratorEngine
+
+            resident_engine = GeneratorEngine(load_model(), config)
+            engine_version = version
+        elif (version not in (engine_version, failed_version) and
+              (reload_thread is None or not reload_thread.is_alive())):
+            reload_thread = Thread(target=reload_engine, args=(version,),
+                                   name='generator-reload', daemon=True)
+            reload_thread.start()
+        return resident_engine
+
+
+def reload_engine(version: str):
+    """
+    Creates an engine from a new checkpoint and swaps it in. The previous
+    engine is closed as soon as its running generate calls have finished.
 
-    dataset = tf.data.Dataset.from_tensor_slices([text])
-    # Parallel inputs must be catched in a single tuple and not considered as multiple arguments.
-    process_fn = lambda *arg: model.source_inputter.process(item_or_tuple(arg))
+    Args:
+        version: The version of the new checkpoint.
+    """
+    global resident_engine, engine_version, failed_version
+    from bot.text_processor.engine import GeneratorEngine
+
+    logger.info('Loading new generator checkpoint {}'.format(version))
+    try:
+        engine = GeneratorEngine(load_model(), config)
+    except Exception as ex:
+        # The previous engine stays in use until the checkpoint changes again
+        logger.error('Generator reload failed: {}: {}'.format(type(ex).__name__, str(ex)))
+        failed_version = version
+        return
+
+    with engine_lock:
+        previous = resident_engine
+        resident_engine = engine
+        engine_version = version
+        idle = previous not in engine_users
+    if idle:
+        previous.close()
+
+
+def generate_texts(texts: List[str]) -> List[str]:
+    """
+    Decodes generator inputs with the current engine.
 
-    dataset = dataset.map(
-        process_fn,
-        num_parallel_calls=1)
-    dataset = dataset.apply(data.batch_parallel_dataset(batch_size))
+    Args:
+        texts: The tokenized input texts.
 
-    iterator = dataset.make_initializable_iterator()
+    Returns:
+        The raw generated answers in the order of the inputs.
+    """
+    load_engine()
+    with engine_lock:
+        engine = resident_engine
+        engine_users[engine] = engine_users.get(engine, 0) + 1
+    try:
+        return engine.generate(texts)
+    finally:
+        with engine_lock:
+            engine_users[engine] -= 1
+            if engine_users[engine] == 0:
+                del engine_users[engine]
+            # The last call of a replaced engine closes it
+            retired = engine is not resident_engine and engine not in engine_users
+        if retired:
+            engine.close()
+
+
+def load_batcher() -> GenerationBatcher:
+    """
+    Returns the generation batcher of this process, creating it on first use.
+    The batcher decodes the inputs of concurrent callers together in one
+    beam search pass, configured by the batch_size and batch_window infer
+    options. Every batch is decoded by the current engine, so the batcher
+    follows new checkpoints.
 
-    # Add the initializer to a standard collection for it to be initialized.
-    # See https://www.tensorflow.org/api_docs/python/tf/Graph for more information
-    # about tensorflow graphs.
-    tf.add_to_collection(tf.GraphKeys.TABLE_INITIALIZERS, iterator.initializer)
+    Returns:
+        The resident generation batcher.
+    """
+    global resident_batcher
+    # Creates the engine before the first batch
+    load_engine()
+    with engine_lock:
+        if resident_batcher is None:
+            resident_batcher = GenerationBatcher(
+                generate_texts,
+                config['infer'].get('batch_size', 1),
+                config['infer'].get('batch_window', 0.0)
+            )
+        return resident_batcher
+
+
+def load_answer_cache() -> Optional[AnswerCache]:
+    """
+    Returns the persistent answer cache of this process, opening it on first
+    use. The cache is configured by the cache section of the config and
+    tagged with the checkpoint of the engine, or the latest checkpoint in the
+    model directory before the engine has been created. The EVE_ANSWER_CACHE
+    environment variable overrides the configured path, an empty value
+    disables the cache.
 
-    return iterator.get_next()
+    Returns:
+        The answer cache, or None if caching is disabled.
+    """
+    global resident_cache
+    cache_config = config.get('cache') or {}
+    cache_path = os.environ.get('EVE_ANSWER_CACHE', cache_config.get('path'))
+    if not cache_path:
+        return None
+    # Answers are stored for the checkpoint of the engine that generates them
+    version = engine_version if engine_version is not None else current_version()
+    with cache_lock:
+        if resident_cache is None:
+            resident_cache = AnswerCache(
+                cache_path,
+                version,
+                cache_config.get('max_entries', 100000),
+                cache_config.get('max_age', 7 * 24 * 60 * 60)
+            )
+        cache = resident_cache
+    cache.set_version(version)
+    return cache
 
 
-def generate_answer(request: Request) -> str:
+def generate_answer(request: Request, message: PreprocessedMessage) -> str:
     """
-    Generates an answer for a given request.
+    Generates an answer for a given request. Answers for generator inputs
+    that have been seen before are taken from the answer cache.
 
     Arguments:
         request: The request to generate an answer for.
+        message: The preprocessed text of the request.
 
     Returns:
         The generated answer.
     """
+    text = message.generator_input
+    cache = load_answer_cache()
+    if cache is not None:
+        answer = cache.get(text)
+        if answer is not None:
+            return answer
 
-    text = ' '.join(nltk.word_tokenize(
-        request.text, language='german')).casefold()
-
-    session_config = tf.ConfigProto(
-        allow_soft_placement=True,
-        log_device_placement=False
-    )
-    run_config = tf.estimator.RunConfig(
-        model_dir=config['model_dir'],
-        session_config=session_config)
-    session = tf.Session(config=session_config)
-    estimator = tf.estimator.Estimator(
-        model.model_fn(num_devices=1),
-        config=run_config,
-        params=config['params']
-    )
-
-    batch_size = config['infer'].get('batch_size', 1)
-
-    # Create an input function as datasource for tensorflow
-    # See https://www.tensorflow.org/get_started/datasets_quickstart
-    # for more information.
-    def input_fn():
-        return input_fn_impl(
-            text,
-            model,
-            batch_size,
-            config['data']
-        )
-
-    # Create a string buffer as output stream
-    stream = StringIO()
-
-    # Format and write all predictions into the output stream
-    for prediction in estimator.predict(input_fn=input_fn):
-        model.print_prediction(prediction, stream=stream)
-
-    # Get the content of the string buffer and close the buffer
-    answer = stream.getvalue()
-    stream.close()
-
-    # Close the tensorflow session
-    session.close()
+    answer = load_batcher().generate(text)
 
     # Clean up output
     answer = clean_output(answer)
 
     if answer == '':
         # If no answer could be generated, fall back to a default answer.
-        answer = 'Da fällt mir jetzt leider nichts zu ein.'
+        answer = DEFAULT_ANSWER
+
+    if cache is not None:
+        cache.put(text, answer)
 
     return answer
+
+
+def generate_answers(messages: List[PreprocessedMessage]) -> List[str]:
+    """
+    Generates answers for many messages at once, e.g. for batch processing.
+    Every distinct generator input that is not in the answer cache is
+    decoded once, by passing all of them to the engine directly, which
+    decodes them in batches of its configured batch size.
+
+    Arguments:
+        messages: The preprocessed texts to generate answers for.
+
+    Returns:
+        The generated answers in the order of the messages.
+    """
+    texts = [message.generator_input for message in messages]
+    cache = load_answer_cache()
+    answers: Dict[str, str] = {}
+    missing: List[str] = []
+    for text in dict.fromkeys(texts):
+        answer = cache.get(text) if cache is not None else None
+        if answer is None:
+            missing.append(text)
+        else:
+            answers[text] = answer
+
+    for text, answer in zip(missing, generate_texts(missing)):
+        answer = clean_output(answer) or DEFAULT_ANSWER
+        answers[text] = answer
+        if cache is not None:
+            cache.put(text, answer)
+
+    return [answers[text] for text in texts]
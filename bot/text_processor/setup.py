@@ -1,8 +1,7 @@
 from os import path, makedirs
-import yaml
+from threading import Lock
 
-from opennmt.models import SequenceToSequence
-from opennmt.config import load_model
+import yaml
 
 
 def load_config(config_path: str):
@@ -27,6 +26,27 @@ model_file = path.join(__dir, 'nmt_small.py')
 config = load_config(config_path)
 
 model_dir = config['model_dir']
-if not path.isdir(model_dir):
-    makedirs(model_dir)
-model = load_model(model_dir, model_file=model_file)
+
+# The OpenNMT model is loaded on first use, as doing so imports TensorFlow
+model = None
+model_lock = Lock()
+
+
+def load_model():
+    """
+    Loads the OpenNMT model definition, creating the model directory if
+    necessary. Importing OpenNMT (and thereby TensorFlow) is deferred until
+    this function is called for the first time.
+
+    Returns:
+        The OpenNMT model.
+    """
+    global model
+    with model_lock:
+        if model is None:
+            from opennmt.config import load_model as load_opennmt_model
+
+            if not path.isdir(model_dir):
+                makedirs(model_dir)
+            model = load_opennmt_model(model_dir, model_file=model_file)
+        return model
@@ -1,9 +1,7 @@
-from os import path, makedirs
-
 from opennmt.runner import Runner
 import tensorflow as tf
 
-from bot.text_processor.setup import config, model
+from bot.text_processor.setup import config, load_model
 
 
 def train():
@@ -11,5 +9,5 @@ def train():
     Trains the OpenNMT model without evaluation.
     """
     tf.logging.set_verbosity(tf.logging.INFO)
-    runner = Runner(model, config)
+    runner = Runner(load_model(), config)
     runner.train()
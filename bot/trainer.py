@@ -1,119 +1,302 @@
-import pickle
-from os import path, mkdir
-from typing import Tuple, List, Dict
+import json
+import multiprocessing
+from os import cpu_count, path
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional
 
 import numpy as np
-from keras.models import Sequential, model_from_json
+from keras.callbacks import EarlyStopping, History
+from keras.models import Sequential
 
+from bot.dense_network import DenseNetwork
+from bot.logger import logger
+from bot.model_artifact import load_artifact, save_artifact, save_training_data
 from bot.model_definitions import Mode
+from bot.model_loader import dir, load_keras_model, model_path
 from bot.setup import setup_bot
-from bot.training_data import TrainingData
+from bot.training_corpus import source_hashes
 
+# Maximum number of epochs a model is trained for
+MAX_EPOCHS = 200
+# Number of epochs without an improvement of the training loss after which
+# training stops early
+PATIENCE = 10
+# Minimum decrease of the training loss that counts as an improvement
+MIN_DELTA = 0.001
+# Number of epochs an existing model is fine-tuned for by incremental training
+FINE_TUNE_EPOCHS = 20
 
-def setup_models_dir() -> str:
-    """
-    Creates the models directory if it does not exist
 
-    Returns:
-        The path to the models directory.
+class TrainingReport(NamedTuple):
     """
-    dir = path.join(path.dirname(__file__), 'models')
-    if not path.exists(dir):
-        mkdir(dir)
-    if not path.isdir(dir):
-        raise Exception('Models path is not a directory: {}'.format(dir))
-    return dir
-
-
-dir = setup_models_dir()
+    Summary of a finished training run.
+    """
+    mode: str
+    epochs: int
+    seconds: float
+    loss: float
+    accuracy: float
 
 
-def train_model(mode: Mode):
+def train_model(mode: Mode, early_stopping: bool = False, verbose: int = 1) -> TrainingReport:
     """
     Trains a neural network with the defined patterns and categories.
     Patterns will be split into words, stemmed by a German snowball stemmer and
     indexed by saving all stems in a list of total stems and assigning indices.
     The trained model will be saved in the models directory and can be loaded
-    by the pattern recognizer using the load_model function.
+    by the pattern recognizer using bot.model_loader.load_model.
 
     Args:
         mode: The mode to the train the model for.
-    """
-    # Creates a directory where the trained models are stored
+        early_stopping:
+            Whether training stops once the training loss has not improved
+            for PATIENCE epochs, instead of always running MAX_EPOCHS epochs.
+        verbose: The verbosity of the Keras training output.
 
+    Returns:
+        The number of epochs, the duration and the final loss and accuracy
+        of the training.
+    """
+    start = perf_counter()
+    sources = source_hashes(mode)
     model, train_x, train_y, words = setup_bot(mode)
 
+    history = fit_model(model, train_x, train_y, MAX_EPOCHS, early_stopping, verbose)
+
+    save_training(mode, model, train_x, train_y, words, sources)
+    return training_report(mode, history, start)
+
+
+def fit_model(
+    model: Sequential,
+    train_x: np.ndarray,
+    train_y: np.ndarray,
+    epochs: int,
+    early_stopping: bool,
+    verbose: int
+) -> History:
+    """
+    Compiles and trains a model created by bot.setup.setup_nn_model.
+
+    Args:
+        model: The model to train.
+        train_x: The feature parameters.
+        train_y: The label parameters.
+        epochs: The maximum number of epochs.
+        early_stopping: Whether training stops once the training loss stops improving.
+        verbose: The verbosity of the Keras training output.
+
+    Returns:
+        The training history.
+    """
     # Compile neural network
     model.compile(loss='categorical_crossentropy',
                   optimizer='adam', metrics=['accuracy'])
     # Train neural network
     # validation_split is set to 0 because our dataset for pattern recognition
-    # is too small to compensate for disregarding data during training
-    model.fit(train_x, train_y, batch_size=32, epochs=200,
-              verbose=1, validation_split=0, shuffle=True)
+    # is too small to compensate for disregarding data during training, so
+    # convergence is detected on the training loss
+    callbacks = []
+    if early_stopping:
+        callbacks.append(EarlyStopping(
+            monitor='loss', min_delta=MIN_DELTA, patience=PATIENCE, verbose=verbose))
+    return model.fit(train_x, train_y, batch_size=32, epochs=epochs,
+                     verbose=verbose, validation_split=0, shuffle=True,
+                     callbacks=callbacks)
 
-    save_training(mode, model, train_x, train_y, words)
 
+def training_report(mode: Mode, history: History, start: float) -> TrainingReport:
+    return TrainingReport(
+        mode=mode.value,
+        epochs=len(history.history['loss']),
+        seconds=perf_counter() - start,
+        loss=float(history.history['loss'][-1]),
+        accuracy=float(history.history['acc'][-1]),
+    )
 
-def save_training(
-    mode: Mode,
+
+def warm_start(
     model: Sequential,
-    train_x: np.ndarray,
-    train_y: np.ndarray,
+    network: DenseNetwork,
+    previous_words: List[str],
     words: List[str]
-):
+) -> bool:
     """
-    Saves the trained model and other relevant trained data.
+    Initializes a new model with the weights of a previously trained network.
+    The input layer is expanded to the new vocabulary: rows of stems known to
+    the previous network keep their trained weights, rows of new stems keep
+    their random initialization and rows of removed stems are dropped.
 
     Args:
-        mode: The mode to save the model for
-        model: The sequential model to save
-        train_x: The feature parameters
-        train_y: The label parameters
-        words: Bag of words used for indexing the words in train_x
+        model: The untrained model for the new vocabulary.
+        network: The previously trained network.
+        previous_words: The vocabulary of the previous network.
+        words: The vocabulary of the new model.
+
+    Returns:
+        Whether the weights could be transferred, which requires both
+        networks to have the same layers apart from the input size.
     """
-    file_name: str = mode.value
+    layers = [layer for layer in model.layers if layer.get_weights()]
+    if len(layers) != len(network.layers):
+        return False
+    for i, (layer, previous) in enumerate(zip(layers, network.layers)):
+        kernel, bias = layer.get_weights()
+        if kernel.shape[1:] != previous.kernel.shape[1:] or bias.shape != previous.bias.shape:
+            return False
+        if i > 0 and kernel.shape != previous.kernel.shape:
+            return False
+
+    kernel = layers[0].get_weights()[0]
+    index = {stem: i for i, stem in enumerate(previous_words)}
+    known = [j for j, stem in enumerate(words) if stem in index]
+    kernel[known] = network.layers[0].kernel[[index[words[j]] for j in known]]
+    layers[0].set_weights([kernel, network.layers[0].bias])
+    for layer, previous in zip(layers[1:], network.layers[1:]):
+        layer.set_weights([previous.kernel, previous.bias])
+    return True
+
+
+def train_incremental(
+    mode: Mode,
+    epochs: int = FINE_TUNE_EPOCHS,
+    verbose: int = 1
+) -> Optional[TrainingReport]:
+    """
+    Updates the model of a mode after its pattern definition files changed.
+    The files are compared with the hashes stored in the current model
+    artifact. If any changed, a model for the new vocabulary is initialized
+    from the current weights and fine-tuned for a few epochs, and the result
+    is saved as a new version of the artifact. Without a current artifact,
+    or if its architecture differs, the model is trained from scratch.
+
+    Args:
+        mode: The mode to update the model for.
+        epochs: The number of epochs the model is fine-tuned for.
+        verbose: The verbosity of the Keras training output.
+
+    Returns:
+        The report of the training, or None if no file changed.
+    """
+    file_path = model_path(mode)
+    if not path.isfile(file_path):
+        logger.info('No model artifact found for {}, training from scratch'.format(mode.value))
+        return train_model(mode, early_stopping=True, verbose=verbose)
 
-    # Save model
-    with open(path.join(dir, '%s-model.json' % file_name), 'w') as f:
-        f.write(model.to_json())
-    model.save_weights(path.join(dir, '%s-weights.h5' % file_name))
-    # Save total_stems and training data
-    with open(path.join(dir, '%s.dump' % file_name), 'wb') as f:
-        pickle.dump(TrainingData(words, train_x, train_y), f)
+    start = perf_counter()
+    sources = source_hashes(mode)
+    previous = load_artifact(file_path, mode)
+    previous_sources: Dict[str, str] = previous.header.get('sources', {})
+    changed = [name for name, digest in sources.items() if previous_sources.get(name) != digest]
+    if not changed:
+        logger.info('Pattern files of {} are unchanged'.format(mode.value))
+        return None
+    logger.info('Changed {} categories: {}'.format(mode.value, ', '.join(changed)))
 
+    model, train_x, train_y, words = setup_bot(mode)
+    if not warm_start(model, previous.network, previous.total_stems, words):
+        logger.warning('Architecture of the {} model changed, training from scratch'.format(
+            mode.value))
+        return train_model(mode, early_stopping=True, verbose=verbose)
 
-# Cache for avoiding unnecessary multiple loading of models
-model_cache: Dict[Mode, Tuple[Sequential, TrainingData]] = {}
+    history = fit_model(model, train_x, train_y, epochs, False, verbose)
 
+    save_training(mode, model, train_x, train_y, words, sources)
+    return training_report(mode, history, start)
 
-def load_model(mode: Mode) -> Tuple[Sequential, TrainingData]:
+
+def train_in_process(mode_value: str, threads: Optional[int] = None) -> TrainingReport:
     """
-    Loads a pre-trained model from disk, as well as the training data dump.
-    If the model has been loaded before during runtime, the cached model
-    will be returned instead.
+    Trains the model of a mode with early stopping in a worker process of
+    train_all.
 
     Args:
-        mode: The mode to load the model for.
+        mode_value: The value of the mode to train.
+        threads: The number of threads TensorFlow may use in this process.
 
     Returns:
-        A pre-trained model loaded from disk as well as an instance of
-        TrainingData, containg the data used for training and the list of total
-        stems used.
+        The report of the training.
     """
+    if threads:
+        import tensorflow as tf
+        from keras import backend
+
+        backend.set_session(tf.Session(config=tf.ConfigProto(
+            intra_op_parallelism_threads=threads,
+            inter_op_parallelism_threads=threads)))
+    return train_model(Mode(mode_value), early_stopping=True, verbose=0)
+
+
+def train_all(workers: int = len(Mode)) -> List[TrainingReport]:
+    """
+    Trains the pattern, mood and affection models concurrently, each in its
+    own process, with early stopping. The processes are spawned instead of
+    forked, as TensorFlow does not support forking. The CPU cores are split
+    between the processes, so they do not compete for the same cores.
+
+    Args:
+        workers: The number of models trained at the same time.
+
+    Returns:
+        The report of every training, in the order of the modes.
+    """
+    threads = max(1, (cpu_count() or 1) // workers)
+    start = perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers) as pool:
+        reports = pool.starmap(train_in_process, [(mode.value, threads) for mode in Mode])
+    total = perf_counter() - start
+
+    print('{:<12} {:>8} {:>10} {:>10} {:>10}'.format(
+        'mode', 'epochs', 'seconds', 'loss', 'accuracy'))
+    for report in reports:
+        print('{:<12} {:>8} {:>10.1f} {:>10.4f} {:>10.4f}'.format(
+            report.mode, report.epochs, report.seconds, report.loss, report.accuracy))
+    print('{:<12} {:>8} {:>10.1f}'.format('total', '', total))
+    print(json.dumps({
+        'models': [report._asdict() for report in reports],
+        'total_seconds': total,
+    }))
+    logger.info('Trained all models in {:.1f}s'.format(total))
+    return reports
 
-    if mode in model_cache:
-        return model_cache[mode]
 
+def save_training(
+    mode: Mode,
+    model: Sequential,
+    train_x: np.ndarray,
+    train_y: np.ndarray,
+    words: List[str],
+    sources: Optional[Dict[str, str]] = None
+):
+    """
+    Saves the trained model as a model artifact, containing the vocabulary
+    and the weights needed for inference. The training matrices are not
+    needed for inference and are saved to a separate archive.
+
+    Args:
+        mode: The mode to save the model for
+        model: The sequential model to save
+        train_x: The feature parameters
+        train_y: The label parameters
+        words: Bag of words used for indexing the words in train_x
+        sources: The hashes of the pattern definition files the model was trained on
+    """
     file_name: str = mode.value
-    with open(path.join(dir, '%s.dump' % file_name), 'rb') as f:
-        data = pickle.load(f)
 
-    with open(path.join(dir, '%s-model.json' % file_name)) as f:
-        model = model_from_json(f.read())
+    save_artifact(model_path(mode), mode, DenseNetwork.from_keras(model), words,
+                  {'sources': sources} if sources is not None else None)
+    save_training_data(path.join(dir, '%s-training.npz' % file_name), train_x, train_y)
 
-    model.load_weights(path.join(dir, '%s-weights.h5' % file_name))
 
-    model_cache[mode] = (model, data)
+def export_model(mode: Mode):
+    """
+    Converts a model saved in the legacy Keras format to a model artifact, so
+    that models trained before the artifact format existed do not have to be
+    retrained.
 
-    return model, data
+    Args:
+        mode: The mode to export the model for.
+    """
+    network, total_stems = load_keras_model(mode)
+    save_artifact(model_path(mode), mode, network, total_stems)
@@ -0,0 +1,155 @@
+import hashlib
+import io
+import json
+from os import path, replace
+from typing import Dict, List, NamedTuple, Tuple
+
+import nltk
+
+from bot import affections, moods, patterns
+from bot.logger import logger
+from bot.model_definitions import Category, Mode
+from bot.model_loader import dir as models_dir
+from bot.preprocessor import stem, tokenize
+
+# Changes whenever the preprocessing of patterns changes, invalidating cached corpora
+CORPUS_VERSION = 1
+
+
+class CategoryCorpus(NamedTuple):
+    """
+    The preprocessed pattern definition file of a category.
+    """
+    # SHA-256 hash of the file the stems were built from
+    digest: str
+    # The sorted, distinct stems of every pattern line
+    stems: List[List[str]]
+
+
+def category_file(mode: Mode, category: Category) -> str:
+    """
+    Returns the path of the pattern definition file of a category.
+
+    Args:
+        mode: The mode the category belongs to.
+        category: The category.
+
+    Returns:
+        The path of the file in the pattern directory of the mode.
+    """
+    directories = {
+        Mode.PATTERNS: patterns.dir,
+        Mode.MOODS: moods.dir,
+        Mode.AFFECTIONS: affections.dir,
+    }
+    return path.join(directories[mode], category.name + '.txt')
+
+
+def read_category(mode: Mode, category: Category) -> Tuple[str, bytes]:
+    """
+    Reads the pattern definition file of a category.
+
+    Raises:
+        FileNotFoundError: Raised if there is no file for the category.
+
+    Returns:
+        The SHA-256 hash and the contents of the file.
+    """
+    with open(category_file(mode, category), 'rb') as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def source_hashes(mode: Mode) -> Dict[str, str]:
+    """
+    Hashes the contents of the pattern definition files of a mode, which
+    are stored with a trained model to detect which files changed since.
+
+    Args:
+        mode: The mode to hash the pattern definition files for.
+
+    Returns:
+        The SHA-256 hash of every file by category name.
+    """
+    return {category.name: read_category(mode, category)[0] for category in mode.category_type}
+
+
+def pattern_stems(data: bytes) -> List[List[str]]:
+    """
+    Tokenizes and stems every line of a pattern definition file, using the
+    same preprocessing as incoming messages.
+
+    Args:
+        data: The contents of the file.
+
+    Returns:
+        The sorted, distinct stems of every line.
+    """
+    # Universal newlines, like reading the file in text mode
+    lines = io.StringIO(data.decode('utf-8'), newline=None)
+    return [sorted(set(stem(tokenize(line.rstrip('\n'))))) for line in lines]
+
+
+def corpus_path(mode: Mode) -> str:
+    return path.join(models_dir, '%s-corpus.json' % mode.value)
+
+
+def load_corpus(mode: Mode) -> Dict[str, CategoryCorpus]:
+    """
+    Loads the cached corpus of a mode. A cache written by a different
+    preprocessing or nltk version is ignored.
+
+    Returns:
+        The cached categories by name, empty if there is no valid cache.
+    """
+    try:
+        with open(corpus_path(mode), encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CORPUS_VERSION or data.get('nltk') != nltk.__version__:
+        return {}
+    return {name: CategoryCorpus(entry['digest'], entry['stems'])
+            for name, entry in data['categories'].items()}
+
+
+def save_corpus(mode: Mode, corpus: Dict[str, CategoryCorpus]):
+    file_path = corpus_path(mode)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': CORPUS_VERSION,
+            'nltk': nltk.__version__,
+            'categories': {name: entry._asdict() for name, entry in corpus.items()},
+        }, f, ensure_ascii=False)
+    replace(temp_path, file_path)
+
+
+def preprocess_corpus(mode: Mode) -> Dict[str, CategoryCorpus]:
+    """
+    Returns the preprocessed pattern definition files of a mode. Files are
+    only tokenized and stemmed again if their content hash differs from the
+    cached one, and the cache is updated afterwards.
+
+    Args:
+        mode: The mode to preprocess the files for.
+
+    Returns:
+        The preprocessed file of every category by name.
+    """
+    cached = load_corpus(mode)
+    corpus: Dict[str, CategoryCorpus] = {}
+    rebuilt = []
+    for category in mode.category_type:
+        digest, data = read_category(mode, category)
+        entry = cached.get(category.name)
+        if entry is None or entry.digest != digest:
+            entry = CategoryCorpus(digest, pattern_stems(data))
+            rebuilt.append(category.name)
+        corpus[category.name] = entry
+
+    if rebuilt or corpus.keys() != cached.keys():
+        save_corpus(mode, corpus)
+    logger.info('Preprocessed {} of {} {} pattern files'.format(
+        len(rebuilt), len(corpus), mode.value))
+    return corpus
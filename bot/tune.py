@@ -0,0 +1,243 @@
+import json
+from time import perf_counter
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from keras import backend
+
+from bot.dense_network import DenseNetwork
+from bot.logger import logger
+from bot.model_definitions import Mode, PatternCategory
+from bot.pattern_recognizer import best_predictions, error_threshold
+from bot.setup import DROPOUT_RATE, read_training_data, setup_nn_model, setup_traing_data
+from bot.trainer import MAX_EPOCHS, fit_model
+
+# Error thresholds the accuracy is measured at, as used by the pattern recognizer
+THRESHOLDS = [0.9, 0.75]
+# Number of timed forward passes per latency measurement
+LATENCY_RUNS = 200
+# Number of messages per forward pass for the batched latency
+BATCH_SIZE = 128
+
+
+class Candidate(NamedTuple):
+    """
+    A network architecture evaluated by the tuning harness.
+    """
+    variant: str
+    units: int
+
+    @property
+    def name(self) -> str:
+        return self.variant if self.variant == 'linear' else '{}-{}'.format(self.variant, self.units)
+
+
+def grid(sizes: List[int], variants: List[str]) -> List[Candidate]:
+    """
+    Returns all candidates for the given hidden sizes and variants. The
+    linear variant has no hidden layer, so it is only included once.
+    """
+    candidates = []
+    for variant in variants:
+        if variant == 'linear':
+            candidates.append(Candidate(variant, 0))
+        else:
+            candidates.extend(Candidate(variant, units) for units in sizes)
+    return candidates
+
+
+def folds(count: int, k: int, seed: int = 0) -> List[np.ndarray]:
+    """
+    Splits the sample indices randomly into k folds of almost equal size.
+    """
+    indices = np.random.RandomState(seed).permutation(count)
+    return np.array_split(indices, k)
+
+
+def threshold_metrics(
+    probabilities: np.ndarray,
+    labels: np.ndarray,
+    mode: Mode,
+    threshold: float
+) -> Dict[str, float]:
+    """
+    Measures the decisions the pattern recognizer would make at an error
+    threshold. A decision is correct if the recognized category is the
+    label, or if nothing is recognized for a BLACKLIST pattern.
+
+    Args:
+        probabilities: The predicted probabilities, one row per sample.
+        labels: The category index of every sample.
+        mode: The mode of the model.
+        threshold: The error threshold.
+
+    Returns:
+        The share of correct decisions (accuracy), of samples with a
+        recognized category (coverage) and of correct recognized categories
+        (precision).
+    """
+    categories, _ = best_predictions(probabilities, mode, threshold)
+    expected = labels.copy()
+    if mode == Mode.PATTERNS:
+        expected[labels == PatternCategory.BLACKLIST.value] = -1
+    accepted = categories >= 0
+    correct = categories == expected
+    return {
+        'accuracy': float(correct.mean()),
+        'coverage': float(accepted.mean()),
+        'precision': float(correct[accepted].mean()) if accepted.any() else 0.0,
+    }
+
+
+def inference_latency(network: DenseNetwork) -> Dict[str, float]:
+    """
+    Measures the median time of the NumPy forward pass for a single message
+    and per message of a batch.
+
+    Returns:
+        The latencies in microseconds.
+    """
+    def median_seconds(input_data: np.ndarray) -> float:
+        timings = []
+        for _ in range(LATENCY_RUNS):
+            start = perf_counter()
+            network.predict(input_data)
+            timings.append(perf_counter() - start)
+        return float(np.median(timings))
+
+    single = np.zeros((1, network.input_size), dtype=np.float32)
+    batch = np.zeros((BATCH_SIZE, network.input_size), dtype=np.float32)
+    return {
+        'single_us': median_seconds(single) * 1e6,
+        'batched_us': median_seconds(batch) * 1e6 / BATCH_SIZE,
+    }
+
+
+def evaluate(
+    mode: Mode,
+    candidate: Candidate,
+    train_x: np.ndarray,
+    train_y: np.ndarray,
+    k: int
+) -> Dict[str, Any]:
+    """
+    Evaluates a candidate with k-fold cross-validation. Every fold is
+    trained with early stopping on the other folds and predicted with the
+    NumPy runtime used by the bot.
+
+    Args:
+        mode: The mode of the training data.
+        candidate: The architecture to evaluate.
+        train_x: The feature parameters of all samples.
+        train_y: The label parameters of all samples.
+        k: The number of folds.
+
+    Returns:
+        The size, training epochs, accuracy and inference latency of the
+        candidate.
+    """
+    labels = train_y.argmax(axis=1)
+    probabilities = np.zeros_like(train_y)
+    epochs = []
+    network: Optional[DenseNetwork] = None
+    for test in folds(len(train_x), k):
+        train = np.setdiff1d(np.arange(len(train_x)), test)
+        model = setup_nn_model(
+            train_x, train_y, candidate.units, DROPOUT_RATE, candidate.variant)
+        history = fit_model(model, train_x[train], train_y[train], MAX_EPOCHS, True, 0)
+        epochs.append(len(history.history['loss']))
+        network = DenseNetwork.from_keras(model)
+        probabilities[test] = network.predict(train_x[test])
+        # Every fold builds a new graph, which would otherwise be kept
+        backend.clear_session()
+
+    result = {
+        'candidate': candidate.name,
+        'variant': candidate.variant,
+        'units': candidate.units,
+        'parameters': sum(layer.kernel.size + layer.bias.size for layer in network.layers),
+        'epochs': float(np.mean(epochs)),
+        'raw_accuracy': float((probabilities.argmax(axis=1) == labels).mean()),
+        'thresholds': {str(threshold): threshold_metrics(probabilities, labels, mode, threshold)
+                       for threshold in THRESHOLDS},
+    }
+    result.update(inference_latency(network))
+    return result
+
+
+def mark_pareto(results: List[Dict[str, Any]], mode: Mode):
+    """
+    Marks the candidates for which no other candidate is at least as
+    accurate at the error threshold of the mode and at least as fast for a
+    single message, while being better in one of both.
+    """
+    key = str(error_threshold(mode))
+    for result in results:
+        accuracy = result['thresholds'][key]['accuracy']
+        result['pareto'] = not any(
+            other['thresholds'][key]['accuracy'] >= accuracy and
+            other['single_us'] <= result['single_us'] and
+            (other['thresholds'][key]['accuracy'] > accuracy or
+             other['single_us'] < result['single_us'])
+            for other in results)
+
+
+def format_results(mode: Mode, results: List[Dict[str, Any]]) -> str:
+    """
+    Formats the results of a mode as a table sorted by single message latency.
+    """
+    header = ['candidate', 'params', 'epochs', 'raw acc']
+    for threshold in THRESHOLDS:
+        header += ['acc@{}'.format(threshold), 'cov@{}'.format(threshold)]
+    header += ['single us', 'batch us', 'pareto']
+    row_format = '{:<12}' + ' {:>10}' * (len(header) - 1)
+    rows = ['{} (error threshold {})'.format(mode.value, error_threshold(mode)),
+            row_format.format(*header)]
+    for result in sorted(results, key=lambda result: result['single_us']):
+        values = [result['candidate'], result['parameters'], '{:.1f}'.format(result['epochs']),
+                  '{:.3f}'.format(result['raw_accuracy'])]
+        for threshold in THRESHOLDS:
+            metrics = result['thresholds'][str(threshold)]
+            values += ['{:.3f}'.format(metrics['accuracy']), '{:.3f}'.format(metrics['coverage'])]
+        values += ['{:.1f}'.format(result['single_us']), '{:.2f}'.format(result['batched_us']),
+                   '*' if result['pareto'] else '']
+        rows.append(row_format.format(*values))
+    return '\n'.join(rows)
+
+
+def tune(
+    modes: List[Mode],
+    sizes: List[int],
+    variants: List[str],
+    k: int,
+    output_path: Optional[str]
+):
+    """
+    Evaluates every candidate architecture for every mode and prints a table
+    per mode, marking the Pareto optimal candidates in terms of accuracy at
+    the mode's error threshold and single message latency.
+
+    Args:
+        modes: The modes to evaluate.
+        sizes: The hidden layer sizes to evaluate.
+        variants: The network variants to evaluate.
+        k: The number of cross-validation folds.
+        output_path: The file the JSON encoded results are written to, if any.
+    """
+    report: Dict[str, List[Dict[str, Any]]] = {}
+    for mode in modes:
+        elements, words = read_training_data(mode)
+        train_x, train_y = setup_traing_data(mode.category_type, elements, words)
+
+        results = []
+        for candidate in grid(sizes, variants):
+            logger.info('Evaluating {} for {}'.format(candidate.name, mode.value))
+            results.append(evaluate(mode, candidate, train_x, train_y, k))
+        mark_pareto(results, mode)
+        report[mode.value] = results
+        print(format_results(mode, results))
+        print()
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)